@@ -0,0 +1,58 @@
+import sys
+import os
+from typing import Dict
+
+from tortoise import connections
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from config import DB_PATH, SQLITE_PRAGMAS, SQLITE_READERS, SQLITE_WRITE_BATCH
+
+
+def sqlite_connection(file_path: str) -> dict:
+    """Tortoise connection settings for a SQLite file.
+
+    The SQLite backends run every credential besides the file path (and the
+    pool sizes) as a ``PRAGMA`` on each connection they open.
+    """
+    if SQLITE_READERS > 0:
+        return {
+            "engine": "app.sqlite_pool",
+            "credentials": {
+                "file_path": file_path,
+                "readers": SQLITE_READERS,
+                "write_batch": SQLITE_WRITE_BATCH,
+                **SQLITE_PRAGMAS,
+            },
+        }
+    return {
+        "engine": "tortoise.backends.sqlite",
+        "credentials": {"file_path": file_path, **SQLITE_PRAGMAS},
+    }
+
+
+TORTOISE_ORM = {
+    "connections": {"default": sqlite_connection(DB_PATH)},
+    "apps": {
+        "models": {
+            "models": [
+                "app.models.user",
+                "app.models.person",
+                "app.models.salary_record",
+                "app.models.salary_field",
+                "app.models.salary_rollup",
+                "app.models.contribution_index",
+            ],
+            "default_connection": "default",
+        }
+    },
+}
+
+
+async def effective_pragmas(connection_name: str = "default") -> Dict[str, object]:
+    """Current values of the configured pragmas on an open connection."""
+    conn = connections.get(connection_name)
+    result = {}
+    for pragma in (*SQLITE_PRAGMAS, "foreign_keys"):
+        _, rows = await conn.execute_query(f"PRAGMA {pragma}")
+        result[pragma] = rows[0][0] if rows else None
+    return result
@@ -1,7 +1,9 @@
-from fastapi import FastAPI, HTTPException
+import logging
+
+from fastapi import Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
 from tortoise.contrib.fastapi import register_tortoise
 
 from .routes.auth import router as auth_router
@@ -9,15 +11,45 @@ from .routes.persons import router as persons_router
 from .routes.salaries import router as salaries_router
 from .routes.stats import router as stats_router
 from .routes.salary_fields import router as salary_fields_router
+from .services.rollups import ensure_rollups
+from .services.contributions import ensure_contributions
+from .services.cache import stats_cache, track_request_versions
+from .services.field_cache import field_cache
+from .utils.auth import get_current_user, token_cache, user_cache
+from .utils.etag import request_etag, etag_matches
+from .db import TORTOISE_ORM, effective_pragmas
+from .migrations import migrate
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-from config import CORS_ORIGINS, DB_PATH
+from config import CORS_ORIGINS
+
+# Shares uvicorn's handler so that startup messages show up in its output
+logger = logging.getLogger("uvicorn.error")
+
+
+def _cache_headers(etag: str) -> dict:
+    # Browsers may keep the body but must revalidate before every reuse;
+    # list endpoints also answer NDJSON when asked for it
+    return {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Accept"}
 
 
 def create_app() -> FastAPI:
     app = FastAPI(title="Salarium", version="0.1.0")
 
+    # Conditional GET: answer 304 when the client already has the current
+    # representation. Registered before CORS so that CORS wraps the 304s.
+    @app.middleware("http")
+    async def conditional_get(request, call_next):
+        track_request_versions()
+        etag = await request_etag(request)
+        if etag and etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=_cache_headers(etag))
+        response = await call_next(request)
+        if etag and response.status_code == 200:
+            response.headers.update(_cache_headers(etag))
+        return response
+
     app.add_middleware(
         CORSMiddleware,
         allow_origins=CORS_ORIGINS,
@@ -26,19 +58,6 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
 
-    # Add no-store cache headers for stats endpoints to ensure fresh data
-    # after salary mutations.
-    @app.middleware("http")
-    async def add_cache_headers(request, call_next):
-        response = await call_next(request)
-        try:
-            path = request.url.path
-            if path.startswith("/api/stats"):
-                response.headers["Cache-Control"] = "no-store"
-        except Exception:
-            pass
-        return response
-
     app.include_router(auth_router, prefix="/api/auth", tags=["auth"])
     app.include_router(persons_router, prefix="/api/persons", tags=["persons"])
     app.include_router(salaries_router, prefix="/api/salaries", tags=["salaries"])
@@ -47,19 +66,42 @@ def create_app() -> FastAPI:
         salary_fields_router, prefix="/api/salary-fields", tags=["salary-fields"]
     )
 
+    @app.get("/api/metrics", tags=["metrics"])
+    def metrics(user=Depends(get_current_user)):
+        """Size and hit counts of the worker's in-process caches."""
+        return {
+            "stats_cache": stats_cache.stats(),
+            "field_cache": field_cache.stats(),
+            "user_cache": user_cache.stats(),
+            "token_cache": token_cache.stats(),
+        }
+
     register_tortoise(
         app,
-        db_url=f"sqlite://{DB_PATH}",
-        modules={"models": [
-            "app.models.user",
-            "app.models.person",
-            "app.models.salary_record",
-            "app.models.salary_field",
-        ]},
+        config=TORTOISE_ORM,
         generate_schemas=True,
         add_exception_handlers=True,
     )
 
+    # These run after the ORM startup hook registered above, which creates
+    # missing tables
+    @app.on_event("startup")
+    async def apply_migrations():
+        for applied in await migrate():
+            logger.info("Applied migration %s", applied)
+
+    @app.on_event("startup")
+    async def log_sqlite_pragmas():
+        pragmas = await effective_pragmas()
+        logger.info(
+            "SQLite pragmas: %s", " ".join(f"{k}={v}" for k, v in pragmas.items())
+        )
+
+    @app.on_event("startup")
+    async def backfill_derived_tables():
+        await ensure_rollups()
+        await ensure_contributions()
+
     static_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static")
     if os.path.exists(static_dir):
         @app.get("/{full_path:path}")
@@ -0,0 +1,73 @@
+"""Versioned schema changes on top of ``generate_schemas``.
+
+``generate_schemas`` only creates missing tables, so everything added to an
+existing database afterwards is a numbered migration here. The version a
+database is at lives in SQLite's ``user_version`` header field; migration
+``n`` is the ``n``-th entry of ``MIGRATIONS`` and runs in its own
+transaction together with the version bump. Statements are idempotent, so a
+fresh database created by ``generate_schemas`` migrates the same way.
+"""
+
+from typing import List, Sequence, Tuple
+
+from tortoise import connections
+from tortoise.transactions import in_transaction
+
+# (description, statements); append only, never edit an applied entry
+MIGRATIONS: List[Tuple[str, Sequence[str]]] = [
+    (
+        "indexes for the per-user access paths",
+        (
+            # Every user-scoped query starts from the user's persons
+            "CREATE INDEX IF NOT EXISTS idx_persons_user ON persons (user_id)",
+            "CREATE INDEX IF NOT EXISTS idx_salary_rollups_user_ym "
+            "ON salary_rollups (user_id, year, month)",
+            # The field cache loads a user's fields in display order
+            "CREATE INDEX IF NOT EXISTS idx_salary_fields_user_order "
+            "ON salary_fields (user_id, display_order, id)",
+            # Deleting a field cascades to its values
+            "CREATE INDEX IF NOT EXISTS idx_custom_salary_values_field "
+            "ON custom_salary_values (salary_field_id)",
+        ),
+    ),
+    (
+        "per-user salary field versions for the field cache",
+        (
+            "CREATE TABLE IF NOT EXISTS salary_field_versions ("
+            "user_id INTEGER NOT NULL PRIMARY KEY, "
+            "version INTEGER NOT NULL DEFAULT 0)",
+        ),
+    ),
+    (
+        "per-user data versions for the stats cache and ETags",
+        (
+            "CREATE TABLE IF NOT EXISTS data_versions ("
+            "user_id INTEGER NOT NULL PRIMARY KEY, "
+            "version INTEGER NOT NULL DEFAULT 0)",
+        ),
+    ),
+]
+
+
+async def schema_version(connection_name: str = "default") -> int:
+    _, rows = await connections.get(connection_name).execute_query(
+        "PRAGMA user_version"
+    )
+    return rows[0][0]
+
+
+async def migrate(connection_name: str = "default") -> List[str]:
+    """Apply pending migrations; returns the descriptions of those applied."""
+    applied = []
+    version = await schema_version(connection_name)
+    for number, (description, statements) in enumerate(MIGRATIONS, start=1):
+        if number <= version:
+            continue
+        # execute_query, not execute_script: sqlite3's executescript commits
+        # the open transaction first, splitting a migration from its bump
+        async with in_transaction(connection_name) as conn:
+            for statement in statements:
+                await conn.execute_query(statement)
+            await conn.execute_query(f"PRAGMA user_version = {number}")
+        applied.append(f"{number:04d} {description}")
+    return applied
@@ -1,6 +1,8 @@
 from .user import User as User
 from .person import Person as Person
 from .salary_record import SalaryRecord as SalaryRecord
+from .salary_rollup import SalaryRollup as SalaryRollup
+from .contribution_index import ContributionIndex as ContributionIndex
 from .salary_field import (
     SalaryField as SalaryField,
     CustomSalaryValue as CustomSalaryValue,
@@ -13,6 +15,8 @@ __all__ = [
     "User",
     "Person",
     "SalaryRecord",
+    "SalaryRollup",
+    "ContributionIndex",
     "SalaryField",
     "CustomSalaryValue",
     "INCOME_CATEGORIES",
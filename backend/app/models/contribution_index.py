@@ -0,0 +1,24 @@
+from tortoise import fields
+from tortoise.models import Model
+
+
+class ContributionIndex(Model):
+    """Running pension/medical/housing fund totals per person and month.
+
+    Amounts are cumulative system contributions in integer cents, excluding
+    the person's pre-system history. Maintained by ``services.contributions``.
+    """
+
+    id = fields.IntField(pk=True)
+    person = fields.ForeignKeyField(
+        "models.Person", related_name="contribution_index"
+    )
+    year = fields.IntField()
+    month = fields.IntField()
+    pension_cents = fields.BigIntField(default=0)
+    medical_cents = fields.BigIntField(default=0)
+    housing_fund_cents = fields.BigIntField(default=0)
+
+    class Meta:
+        table = "contribution_index"
+        unique_together = ("person_id", "year", "month")
@@ -0,0 +1,33 @@
+from tortoise import fields
+from tortoise.models import Model
+
+
+class SalaryRollup(Model):
+    """Derived per-record totals used by the stats endpoints.
+
+    One row per (person, year, month), kept in sync with ``salary_records``
+    and their custom values by ``services.rollups``.
+    """
+
+    id = fields.IntField(pk=True)
+    user = fields.ForeignKeyField("models.User", related_name="salary_rollups")
+    person = fields.ForeignKeyField("models.Person", related_name="salary_rollups")
+    year = fields.IntField()
+    month = fields.IntField()
+
+    # Unified-spec totals (see routes/stats.py)
+    income_total = fields.DecimalField(max_digits=15, decimal_places=2, default=0)
+    deductions_total = fields.DecimalField(max_digits=15, decimal_places=2, default=0)
+    benefits_total = fields.DecimalField(max_digits=15, decimal_places=2, default=0)
+    net_income = fields.DecimalField(max_digits=15, decimal_places=2, default=0)
+    tax = fields.DecimalField(max_digits=15, decimal_places=2, default=0)
+
+    # compute_payroll totals (include custom fields)
+    actual_take_home = fields.DecimalField(max_digits=15, decimal_places=2, default=0)
+    non_cash_benefits = fields.DecimalField(
+        max_digits=15, decimal_places=2, default=0
+    )
+
+    class Meta:
+        table = "salary_rollups"
+        unique_together = ("person_id", "year", "month")
@@ -4,26 +4,34 @@ from tortoise.exceptions import IntegrityError, DoesNotExist
 from ..models import User
 from ..schemas.auth import LoginRequest, RegisterRequest, TokenResponse, UserOut
 from ..utils.auth import (
+    PasswordWorkBusy,
     verify_password,
     hash_password,
     create_access_token,
     get_current_user,
+    token_claims,
 )
 
 
 router = APIRouter()
 
+_BUSY = HTTPException(
+    status_code=503, detail="服务繁忙，请稍后再试", headers={"Retry-After": "1"}
+)
+
 
 @router.post("/register", response_model=UserOut)
 async def register(payload: RegisterRequest):
     try:
-        hashed_password = hash_password(payload.password)
+        hashed_password = await hash_password(payload.password)
         user = await User.create(
             username=payload.username, password_hash=hashed_password
         )
         return UserOut(id=user.id, username=user.username)
     except IntegrityError:
         raise HTTPException(status_code=400, detail="用户名已存在")
+    except PasswordWorkBusy:
+        raise _BUSY
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"注册失败: {str(e)}")
 
@@ -35,10 +43,14 @@ async def login(payload: LoginRequest):
     except DoesNotExist:
         raise HTTPException(status_code=400, detail="用户名或密码错误")
 
-    if not verify_password(payload.password, user.password_hash):
+    try:
+        valid = await verify_password(payload.password, user.password_hash)
+    except PasswordWorkBusy:
+        raise _BUSY
+    if not valid:
         raise HTTPException(status_code=400, detail="用户名或密码错误")
 
-    token = create_access_token({"sub": user.username})
+    token = create_access_token(token_claims(user))
     return TokenResponse(access_token=token)
 
 
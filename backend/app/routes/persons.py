@@ -3,6 +3,7 @@ from typing import List
 
 from ..models import Person
 from ..schemas.person import PersonCreate, PersonUpdate, PersonOut
+from ..services.cache import bump_data_version
 from ..utils.auth import get_current_user
 
 
@@ -32,6 +33,7 @@ async def create_person(payload: PersonCreate, user=Depends(get_current_user)):
         medical_history=payload.medical_history,
         housing_fund_history=payload.housing_fund_history
     )
+    await bump_data_version(user.id)
     return PersonOut(
         id=p.id, 
         name=p.name, 
@@ -60,6 +62,7 @@ async def update_person(
     if payload.housing_fund_history is not None:
         p.housing_fund_history = payload.housing_fund_history
     await p.save()
+    await bump_data_version(user.id)
     return PersonOut(
         id=p.id, 
         name=p.name, 
@@ -75,4 +78,5 @@ async def delete_person(person_id: int, user=Depends(get_current_user)):
     deleted = await Person.filter(id=person_id, user_id=user.id).delete()
     if not deleted:
         raise HTTPException(status_code=404, detail="人员不存在")
+    await bump_data_version(user.id)
     return {"ok": True}
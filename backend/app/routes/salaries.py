@@ -1,86 +1,109 @@
-from typing import List, Optional, Dict, Tuple
-from fastapi import APIRouter, HTTPException, Query, Depends
-
-from ..models import SalaryRecord, Person, SalaryField, CustomSalaryValue
-from ..schemas.salary import SalaryCreate, SalaryUpdate, SalaryOut
-from ..services.payroll import compute_payroll
+import base64
+from decimal import Decimal
+from typing import AsyncIterator, List, Literal, Optional, Dict, Tuple, Union
+from fastapi import APIRouter, HTTPException, Query, Depends, Header, UploadFile, File
+from tortoise.expressions import Q
+from tortoise.transactions import in_transaction
+
+from ..models import SalaryRecord, Person, CustomSalaryValue
+from ..schemas.salary import (
+    SalaryCreate,
+    SalaryUpdate,
+    SalaryOut,
+    SalaryPage,
+    SalaryImportResult,
+    SalaryImportRowError,
+)
+from ..services.payroll import (
+    compute_payroll,
+    compute_payroll_batch,
+    payroll_inputs,
+    payroll_rows,
+)
+from ..services.rollups import refresh_rollups
+from ..services.contributions import refresh_contributions
+from ..services.cache import bump_data_version
+from ..services.aggregates import load_custom_values
+from ..services.field_cache import user_fields
+from ..services.money import from_cents, to_cents
+from ..services.salary_import import import_salary_sheet
 from ..utils.auth import get_current_user
+from ..utils.streaming import STREAM_CHUNK_SIZE, ndjson_response, wants_ndjson
 
 
 router = APIRouter()
 
 
-async def load_custom_fields(
-    record_ids: List[int],
-) -> Tuple[Dict[int, Dict[str, float]], Dict[int, List[dict]]]:
-    """Batch load custom field values for salary records."""
-    if not record_ids:
-        return {}, {}
-
-    values = await CustomSalaryValue.filter(
-        salary_record_id__in=record_ids
-    ).prefetch_related("salary_field").all()
-
-    by_record: Dict[int, Dict[str, float]] = {}
-    for v in values:
-        by_record.setdefault(v.salary_record_id, {})[v.salary_field.field_key] = float(
-            v.amount
-        )
-
-    payroll_by_record: Dict[int, List[dict]] = {}
-    for v in values:
-        payroll_by_record.setdefault(v.salary_record_id, []).append(
-            {
-                "field_type": v.salary_field.field_type,
-                "is_non_cash": v.salary_field.is_non_cash,
-                "amount": float(v.amount),
-            }
-        )
-
-    return by_record, payroll_by_record
-
-
 async def save_custom_fields(
     record_id: int, user_id: int, custom_fields: dict
 ) -> None:
-    """Save custom field values for a salary record."""
+    """Save custom field values for a salary record.
+
+    The record ends up with exactly the non-zero values of ``custom_fields``
+    for the user's active fields. Only the difference to what is stored is
+    written: one DELETE for removed values and one upsert for new or changed
+    ones, however many fields there are. Callers refresh the record's rollup
+    in the same transaction.
+    """
     if not custom_fields:
         return
 
-    # Get user's field definitions
-    field_defs = await SalaryField.filter(user_id=user_id, is_active=True).all()
-    field_map = {f.field_key: f for f in field_defs}
-
-    # Delete existing custom values for this record
-    await CustomSalaryValue.filter(salary_record_id=record_id).delete()
-
-    # Create new custom values
-    for field_key, amount in custom_fields.items():
-        if field_key in field_map and amount != 0:
-            await CustomSalaryValue.create(
-                salary_record_id=record_id,
-                salary_field_id=field_map[field_key].id,
-                amount=amount,
-            )
+    field_ids = (await user_fields(user_id)).active_ids
+    wanted = {
+        field_ids[key]: to_cents(amount)
+        for key, amount in custom_fields.items()
+        if key in field_ids and amount != 0
+    }
+    stored = {
+        field_id: (value_id, to_cents(amount))
+        for value_id, field_id, amount in await CustomSalaryValue.filter(
+            salary_record_id=record_id
+        ).values_list("id", "salary_field_id", "amount")
+    }
+
+    removed = [
+        value_id for field_id, (value_id, _) in stored.items() if field_id not in wanted
+    ]
+    if removed:
+        await CustomSalaryValue.filter(id__in=removed).delete()
+
+    upserts = [
+        CustomSalaryValue(
+            salary_record_id=record_id,
+            salary_field_id=field_id,
+            amount=from_cents(cents),
+        )
+        for field_id, cents in wanted.items()
+        if field_id not in stored or stored[field_id][1] != cents
+    ]
+    if upserts:
+        await CustomSalaryValue.bulk_create(
+            upserts,
+            on_conflict=("salary_record_id", "salary_field_id"),
+            update_fields=["amount"],
+        )
 
 
 def build_salary_out(
     rec: SalaryRecord,
     custom_fields_data: Dict[str, float],
     custom_fields_payroll: List[dict],
+    data: Optional[Dict[str, Decimal]] = None,
 ) -> SalaryOut:
-    data = compute_payroll(
-        base_salary=rec.base_salary,
-        performance_salary=rec.performance_salary,
-        pension_insurance=rec.pension_insurance,
-        medical_insurance=rec.medical_insurance,
-        unemployment_insurance=rec.unemployment_insurance,
-        critical_illness_insurance=rec.critical_illness_insurance,
-        enterprise_annuity=rec.enterprise_annuity,
-        housing_fund=rec.housing_fund,
-        tax=rec.tax,
-        custom_fields=custom_fields_payroll or [],
-    )
+    """Response model for a record; ``data`` is its precomputed payroll, if any."""
+    if data is None:
+        data = compute_payroll(
+            base_salary=rec.base_salary,
+            performance_salary=rec.performance_salary,
+            pension_insurance=rec.pension_insurance,
+            medical_insurance=rec.medical_insurance,
+            unemployment_insurance=rec.unemployment_insurance,
+            critical_illness_insurance=rec.critical_illness_insurance,
+            enterprise_annuity=rec.enterprise_annuity,
+            housing_fund=rec.housing_fund,
+            tax=rec.tax,
+            custom_fields=custom_fields_payroll or [],
+        )
     return SalaryOut(
         id=rec.id,
         year=rec.year,
@@ -105,13 +128,96 @@ def build_salary_out(
     )
 
 
-@router.get("/", response_model=List[SalaryOut])
+async def build_salary_outs(
+    user_id: int, records: List[SalaryRecord]
+) -> List[SalaryOut]:
+    """Response models for several records, with one custom value query."""
+    record_ids = [r.id for r in records]
+    custom_data_map, custom_payroll_map = await load_custom_values(record_ids)
+    payroll = payroll_rows(
+        compute_payroll_batch(**payroll_inputs(records, custom_payroll_map))
+    )
+    return [
+        build_salary_out(
+            r,
+            custom_data_map.get(r.id, {}),
+            custom_payroll_map.get(r.id, []),
+            data,
+        )
+        for r, data in zip(records, payroll)
+    ]
+
+
+async def _stream_salary_outs(user_id: int, q) -> AsyncIterator[List[SalaryOut]]:
+    # Keyset over id so every chunk is an indexed range scan
+    last_id = 0
+    while True:
+        records = await q.filter(id__gt=last_id).order_by("id").limit(
+            STREAM_CHUNK_SIZE
+        )
+        if records:
+            yield await build_salary_outs(user_id, records)
+        if len(records) < STREAM_CHUNK_SIZE:
+            return
+        last_id = records[-1].id
+
+
+# Keyset pagination order; id breaks ties and makes every position unique
+_PAGE_KEY = ("year", "month", "person_id", "id")
+
+
+def _encode_cursor(rec: SalaryRecord) -> str:
+    raw = ".".join(str(getattr(rec, col)) for col in _PAGE_KEY)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[int, ...]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        values = tuple(int(v) for v in raw.split("."))
+    except ValueError:
+        values = ()
+    if len(values) != len(_PAGE_KEY):
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+    return values
+
+
+def _after_cursor(values: Tuple[int, ...], descending: bool) -> Q:
+    """Records strictly after ``values`` in the page order."""
+    op = "lt" if descending else "gt"
+    q = None
+    for i, col in enumerate(_PAGE_KEY):
+        equal = {c: v for c, v in zip(_PAGE_KEY[:i], values)}
+        term = Q(**equal, **{f"{col}__{op}": values[i]})
+        q = term if q is None else q | term
+    return q
+
+
+@router.get("/", response_model=Union[List[SalaryOut], SalaryPage])
 async def list_salaries(
     user=Depends(get_current_user),
     person_id: Optional[int] = Query(default=None),
     year: Optional[int] = Query(default=None),
     month: Optional[int] = Query(default=None),
+    limit: Optional[int] = Query(default=None, ge=1, le=500, description="每页条数"),
+    cursor: Optional[str] = Query(default=None, description="上一页的 next_cursor"),
+    sort: Optional[Literal["asc", "desc"]] = Query(
+        default=None, description="按 年/月/人员 排序"
+    ),
+    stream: bool = Query(default=False, description="以 NDJSON 流式返回"),
+    accept: Optional[str] = Header(default=None),
 ):
+    """Salary records of the user, optionally paginated or streamed.
+
+    With ``limit`` the response is a ``SalaryPage`` ordered by (year, month,
+    person_id, id), ascending unless ``sort=desc``; pass its ``next_cursor``
+    back as ``cursor`` for the next page. Custom values are loaded for the
+    page only. Without ``limit`` the whole list is returned, ordered when
+    ``sort`` is given.
+
+    ``stream=1`` or ``Accept: application/x-ndjson`` writes all records in
+    id order, a chunk at a time, instead of building the whole list.
+    """
     q = SalaryRecord.filter(person__user_id=user.id)
     if person_id:
         q = q.filter(person_id=person_id)
@@ -119,17 +225,54 @@ async def list_salaries(
         q = q.filter(year=year)
     if month:
         q = q.filter(month=month)
-    records = await q.all()
-    record_ids = [r.id for r in records]
-    custom_data_map, custom_payroll_map = await load_custom_fields(record_ids)
-    return [
-        build_salary_out(
-            r,
-            custom_data_map.get(r.id, {}),
-            custom_payroll_map.get(r.id, []),
+    if wants_ndjson(accept, stream):
+        return ndjson_response(_stream_salary_outs(user.id, q))
+
+    descending = sort == "desc"
+    if sort or limit:
+        q = q.order_by(*(f"-{c}" if descending else c for c in _PAGE_KEY))
+    if not limit:
+        return await build_salary_outs(user.id, await q.all())
+
+    if cursor:
+        q = q.filter(_after_cursor(_decode_cursor(cursor), descending))
+    # One extra row tells whether another page follows
+    records = await q.limit(limit + 1)
+    page = records[:limit]
+    next_cursor = _encode_cursor(page[-1]) if len(records) > limit else None
+    return SalaryPage(
+        items=await build_salary_outs(user.id, page), next_cursor=next_cursor
+    )
+
+
+@router.post("/import", response_model=SalaryImportResult)
+async def import_salaries(
+    file: UploadFile = File(..., description="CSV 或 XLSX 文件"),
+    user=Depends(get_current_user),
+):
+    """Create or update many salary records from a spreadsheet.
+
+    See ``services.salary_import`` for the expected columns. Valid rows are
+    written in one transaction; invalid ones are skipped and listed in
+    ``errors`` by spreadsheet row number.
+    """
+    content = await file.read()
+    try:
+        created, updated, errors = await import_salary_sheet(
+            user.id, content, file.filename
         )
-        for r in records
-    ]
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if created or updated:
+        await bump_data_version(user.id)
+    return SalaryImportResult(
+        created=created,
+        updated=updated,
+        errors=[
+            SalaryImportRowError(row=row, errors=messages)
+            for row, messages in errors.items()
+        ],
+    )
 
 
 @router.post("/{person_id}", response_model=SalaryOut)
@@ -140,27 +283,34 @@ async def create_salary(
     if not person:
         raise HTTPException(status_code=404, detail="人员不存在")
 
-    rec = await SalaryRecord.create(
-        person_id=person_id,
-        year=payload.year,
-        month=payload.month,
-        base_salary=payload.base_salary,
-        performance_salary=payload.performance_salary,
-        pension_insurance=payload.pension_insurance,
-        medical_insurance=payload.medical_insurance,
-        unemployment_insurance=payload.unemployment_insurance,
-        critical_illness_insurance=payload.critical_illness_insurance,
-        enterprise_annuity=payload.enterprise_annuity,
-        housing_fund=payload.housing_fund,
-        tax=payload.tax,
-        note=payload.note,
-    )
+    async with in_transaction():
+        rec = await SalaryRecord.create(
+            person_id=person_id,
+            year=payload.year,
+            month=payload.month,
+            base_salary=payload.base_salary,
+            performance_salary=payload.performance_salary,
+            pension_insurance=payload.pension_insurance,
+            medical_insurance=payload.medical_insurance,
+            unemployment_insurance=payload.unemployment_insurance,
+            critical_illness_insurance=payload.critical_illness_insurance,
+            enterprise_annuity=payload.enterprise_annuity,
+            housing_fund=payload.housing_fund,
+            tax=payload.tax,
+            note=payload.note,
+        )
 
-    # Save custom fields
-    if payload.custom_fields:
-        await save_custom_fields(rec.id, user.id, payload.custom_fields)
+        # Save custom fields
+        if payload.custom_fields:
+            await save_custom_fields(rec.id, user.id, payload.custom_fields)
+
+        await refresh_rollups(
+            user.id, person_id=person_id, year=rec.year, month=rec.month
+        )
+        await refresh_contributions(person_id, rec.year, rec.month)
+    await bump_data_version(user.id)
 
-    custom_data_map, custom_payroll_map = await load_custom_fields([rec.id])
+    custom_data_map, custom_payroll_map = await load_custom_values([rec.id])
     return build_salary_out(
         rec,
         custom_data_map.get(rec.id, {}),
@@ -173,7 +323,7 @@ async def get_salary(record_id: int, user=Depends(get_current_user)):
     rec = await SalaryRecord.filter(id=record_id, person__user_id=user.id).first()
     if not rec:
         raise HTTPException(status_code=404, detail="记录不存在")
-    custom_data_map, custom_payroll_map = await load_custom_fields([rec.id])
+    custom_data_map, custom_payroll_map = await load_custom_values([rec.id])
     return build_salary_out(
         rec,
         custom_data_map.get(rec.id, {}),
@@ -189,17 +339,26 @@ async def update_salary(
     if not rec:
         raise HTTPException(status_code=404, detail="记录不存在")
 
-    # Update fixed fields
-    update_data = payload.model_dump(exclude_unset=True, exclude={"custom_fields"})
-    for field, value in update_data.items():
-        setattr(rec, field, value)
-    await rec.save()
+    async with in_transaction():
+        # Update fixed fields
+        update_data = payload.model_dump(
+            exclude_unset=True, exclude={"custom_fields"}
+        )
+        for field, value in update_data.items():
+            setattr(rec, field, value)
+        await rec.save()
+
+        # Update custom fields if provided
+        if payload.custom_fields is not None:
+            await save_custom_fields(rec.id, user.id, payload.custom_fields)
 
-    # Update custom fields if provided
-    if payload.custom_fields is not None:
-        await save_custom_fields(rec.id, user.id, payload.custom_fields)
+        await refresh_rollups(
+            user.id, person_id=rec.person_id, year=rec.year, month=rec.month
+        )
+        await refresh_contributions(rec.person_id, rec.year, rec.month)
+    await bump_data_version(user.id)
 
-    custom_data_map, custom_payroll_map = await load_custom_fields([rec.id])
+    custom_data_map, custom_payroll_map = await load_custom_values([rec.id])
     return build_salary_out(
         rec,
         custom_data_map.get(rec.id, {}),
@@ -213,8 +372,14 @@ async def delete_salary(record_id: int, user=Depends(get_current_user)):
     if not rec:
         raise HTTPException(status_code=404, detail="记录不存在")
 
-    # Delete custom values first (cascade)
-    await CustomSalaryValue.filter(salary_record_id=rec.id).delete()
+    async with in_transaction():
+        # Delete custom values first (cascade)
+        await CustomSalaryValue.filter(salary_record_id=rec.id).delete()
 
-    await rec.delete()
+        await rec.delete()
+        await refresh_rollups(
+            user.id, person_id=rec.person_id, year=rec.year, month=rec.month
+        )
+        await refresh_contributions(rec.person_id, rec.year, rec.month)
+    await bump_data_version(user.id)
     return {"ok": True}
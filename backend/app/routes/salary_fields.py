@@ -1,4 +1,5 @@
 from fastapi import APIRouter, HTTPException, Depends
+from tortoise.transactions import in_transaction
 from typing import List
 
 from ..models import (
@@ -13,6 +14,9 @@ from ..schemas.salary_field import (
     SalaryFieldOut,
     CategoryOut,
 )
+from ..services.rollups import refresh_rollups
+from ..services.cache import bump_data_version
+from ..services.field_cache import invalidate_fields, user_fields
 from ..utils.auth import get_current_user
 
 
@@ -35,26 +39,12 @@ async def list_salary_fields(
     user=Depends(get_current_user),
 ):
     """List all salary field definitions for the current user."""
-    filters = {"user_id": user.id}
-    if field_type:
-        filters["field_type"] = field_type
-    if not include_inactive:
-        filters["is_active"] = True
-
-    fields = await SalaryField.filter(**filters).order_by("display_order", "id").all()
+    fields = (await user_fields(user.id)).ordered
     return [
-        SalaryFieldOut(
-            id=f.id,
-            name=f.name,
-            field_key=f.field_key,
-            field_type=f.field_type,
-            category=f.category,
-            is_non_cash=f.is_non_cash,
-            display_order=f.display_order,
-            is_active=f.is_active,
-            created_at=f.created_at,
-        )
+        SalaryFieldOut(**f._asdict())
         for f in fields
+        if (not field_type or f.field_type == field_type)
+        and (include_inactive or f.is_active)
     ]
 
 
@@ -71,11 +61,9 @@ async def create_salary_field(
             detail=f"无效的类别 '{payload.category}'，有效类别: {valid_categories}",
         )
 
-    # Check for duplicate field_key
-    existing = await SalaryField.filter(
-        user_id=user.id, field_key=payload.field_key
-    ).first()
-    if existing:
+    # Check for duplicate field_key (inactive fields keep theirs)
+    fields = (await user_fields(user.id)).ordered
+    if any(f.field_key == payload.field_key for f in fields):
         raise HTTPException(
             status_code=400, detail=f"字段标识 '{payload.field_key}' 已存在"
         )
@@ -89,6 +77,8 @@ async def create_salary_field(
         is_non_cash=payload.is_non_cash,
         display_order=payload.display_order,
     )
+    await invalidate_fields(user.id)
+    await bump_data_version(user.id)
     return SalaryFieldOut(
         id=f.id,
         name=f.name,
@@ -121,6 +111,10 @@ async def update_salary_field(
                 detail=f"无效的类别 '{payload.category}'，有效类别: {valid_categories}",
             )
         f.category = payload.category
+    # Changing the non-cash flag moves amounts between take-home and benefits
+    non_cash_changed = (
+        payload.is_non_cash is not None and payload.is_non_cash != f.is_non_cash
+    )
     if payload.is_non_cash is not None:
         f.is_non_cash = payload.is_non_cash
     if payload.display_order is not None:
@@ -128,7 +122,12 @@ async def update_salary_field(
     if payload.is_active is not None:
         f.is_active = payload.is_active
 
-    await f.save()
+    async with in_transaction():
+        await f.save()
+        if non_cash_changed:
+            await refresh_rollups(user.id)
+    await invalidate_fields(user.id)
+    await bump_data_version(user.id)
     return SalaryFieldOut(
         id=f.id,
         name=f.name,
@@ -151,4 +150,6 @@ async def delete_salary_field(field_id: int, user=Depends(get_current_user)):
 
     f.is_active = False
     await f.save()
+    await invalidate_fields(user.id)
+    await bump_data_version(user.id)
     return {"ok": True}
@@ -1,143 +1,165 @@
-from typing import List, Optional, Dict
-from fastapi import APIRouter, HTTPException, Query, Depends
+import inspect
+from typing import AsyncIterator, List, Literal, Optional, Dict, Type
+from fastapi import APIRouter, HTTPException, Query, Depends, Header
+from fastapi.responses import StreamingResponse
 from decimal import Decimal
+from pydantic import BaseModel
+from pydantic.fields import FieldInfo
+from tortoise.expressions import Q
 
-from ..models import SalaryRecord, Person, CustomSalaryValue
+from ..models import Person, ContributionIndex
 from ..schemas.stats import (
     MonthlyStats, YearlyStats, FamilySummary,
     PersonCumulativeInsurance, BenefitStats, IncomeComposition,
     MonthlyNetIncome, GrossVsNetMonthly,
     DeductionsBreakdown, DeductionsMonthly, DeductionsBreakdownItem,
     ContributionsCumulative, ContributionsCumulativePoint,
-    MonthlyTableRow, AnnualTableRow, AnnualMonthlyRow,
+    MonthlyTableRow, AnnualTableRow, AnnualMonthlyRow, StatsBatch,
 )
 from ..utils.auth import get_current_user
-from ..services.payroll import compute_payroll
+from ..utils.streaming import (
+    STREAM_CHUNK_SIZE,
+    csv_response,
+    ndjson_response,
+    wants_ndjson,
+    xlsx_response,
+)
+from ..services.cache import cached_stats
+from ..services.field_cache import user_fields
+from ..services.payroll import (
+    compute_payroll_batch,
+    payroll_inputs,
+)
+from ..services.money import Cents, to_cents, cents_to_float, cents_percent
+from ..services.aggregates import (
+    SALARY_COLUMNS,
+    YMRange,
+    EMPTY_CUSTOM,
+    iter_salary_rows,
+    load_salary_rows,
+    sum_salary_columns,
+    sum_custom_values,
+    sum_custom_by_field,
+    custom_values_by_record,
+    load_custom_values,
+    sum_rollups,
+    sum_contributions_by_person,
+    insurance_total,
+    payroll_totals,
+    unified_totals,
+)
+from ..services.stats_fields import (
+    ZERO_FIELDS,
+    SalaryRow,
+    cents_getter,
+    cents_sum,
+    float_fields,
+    schema_fields,
+)
 
 
 router = APIRouter()
 
 
-# Helpers for stats calculations aligned with the unified calculation spec
-def _D(v):
-    return v if isinstance(v, Decimal) else Decimal(str(v or 0))
-
-# Safe field accessor - handles both direct fields and missing custom fields
-def _F(record, field_name, default=0):
-    """Safely get a field value from record, returns default if missing."""
-    try:
-        return getattr(record, field_name, default)
-    except AttributeError:
-        return default
-
-
-async def load_custom_fields_for_payroll(
-    record_ids: List[int],
-) -> Dict[int, List[dict]]:
-    """Batch load custom field info for payroll calculation."""
-    if not record_ids:
-        return {}
-    values = await CustomSalaryValue.filter(
-        salary_record_id__in=record_ids
-    ).prefetch_related("salary_field").all()
-    payroll_map: Dict[int, List[dict]] = {}
-    for v in values:
-        payroll_map.setdefault(v.salary_record_id, []).append(
-            {
-                "field_type": v.salary_field.field_type,
-                "is_non_cash": v.salary_field.is_non_cash,
-                "amount": float(v.amount),
-            }
-        )
-    return payroll_map
-
+# Per-record accessors compiled from the stats field registry. Amounts are
+# summed as integer cents and converted only in the responses.
 
 # Allowances used for net income (exclude meal allowance as per spec)
 # net = base + performance + high + low + computer - deductions
 # meal allowance is not counted toward actual take-home
-
-def _allowances_sum_net(r: SalaryRecord) -> Decimal:
-    return (
-        _D(_F(r, "high_temp_allowance"))
-        + _D(_F(r, "low_temp_allowance"))
-        + _D(_F(r, "computer_allowance"))
-        + _D(_F(r, "communication_allowance"))
-        + _D(_F(r, "comprehensive_allowance"))
-    )
+_NET_ALLOWANCES = (
+    "high_temp_allowance",
+    "low_temp_allowance",
+    "computer_allowance",
+    "communication_allowance",
+    "comprehensive_allowance",
+)
+_allowances_sum_net = cents_sum(*_NET_ALLOWANCES)
 
 # Allowances for composition/gross (include meal allowance)
-
-def _allowances_sum_full(r: SalaryRecord) -> Decimal:
-    return (
-        _D(_F(r, "high_temp_allowance"))
-        + _D(_F(r, "low_temp_allowance"))
-        + _D(_F(r, "meal_allowance"))
-        + _D(_F(r, "computer_allowance"))
-        + _D(_F(r, "communication_allowance"))
-        + _D(_F(r, "comprehensive_allowance"))
-    )
+_allowances_sum_full = cents_sum(*_NET_ALLOWANCES, "meal_allowance")
 
 # Benefits grouping (festival welfare only; excludes meal allowance)
+_BENEFITS = ("mid_autumn_benefit", "dragon_boat_benefit", "spring_festival_benefit")
+_benefits_sum = cents_sum(*_BENEFITS)
+
+_INSURANCE = (
+    "pension_insurance",
+    "medical_insurance",
+    "unemployment_insurance",
+    "critical_illness_insurance",
+    "enterprise_annuity",
+    "housing_fund",
+)
+_insurance_sum = cents_sum(*_INSURANCE)
 
-def _benefits_sum(r: SalaryRecord) -> Decimal:
-    return (
-        _D(_F(r, "mid_autumn_benefit"))
-        + _D(_F(r, "dragon_boat_benefit"))
-        + _D(_F(r, "spring_festival_benefit"))
-    )
+_DEDUCTIONS = (
+    *_INSURANCE,
+    "other_deductions",
+    "labor_union_fee",
+    "performance_deduction",
+)
+_deductions_sum = cents_sum(*_DEDUCTIONS)
+
+# Gross income for waterfall and gross-vs-net charts.
+# Excludes meal allowance and festival benefits per unified spec.
+# 应发 = 基本工资 + 绩效工资 + 高温补贴 + 低温补贴 + 电脑补贴 + 其他
+# （排除：餐补、三节福利）
+_gross_income_for_net_charts = cents_sum(
+    "base_salary", "performance_salary", *_NET_ALLOWANCES, "other_income"
+)
 
+_net_income_items = cents_sum("base_salary", "performance_salary", *_NET_ALLOWANCES)
 
-def _gross_income_for_net_charts(r: SalaryRecord) -> Decimal:
-    """Gross income for waterfall and gross-vs-net charts.
 
-    Excludes meal allowance and festival benefits per unified spec.
-    应发 = 基本工资 + 绩效工资 + 高温补贴 + 低温补贴 + 电脑补贴 + 其他
-    （排除：餐补、三节福利）
+def _unified_net_income(r: SalaryRow) -> Cents:
+    """Net income according to unified spec:
+    net = base + performance + high + low + computer - (all deductions)
+    Note: excludes meal/benefits and excludes other_income and tax.
     """
-    return (
-        _D(r.base_salary)
-        + _D(r.performance_salary)
-        + _allowances_sum_net(r)  # excludes meal allowance
-        + _D(_F(r, "other_income"))
-    )
+    return _net_income_items(r) - _deductions_sum(r)
 
 
-def _deductions_sum(r: SalaryRecord) -> Decimal:
-    return (
-        _D(r.pension_insurance)
-        + _D(r.medical_insurance)
-        + _D(r.unemployment_insurance)
-        + _D(r.critical_illness_insurance)
-        + _D(r.enterprise_annuity)
-        + _D(r.housing_fund)
-        + _D(_F(r, "other_deductions"))
-        + _D(_F(r, "labor_union_fee"))
-        + _D(_F(r, "performance_deduction"))
-    )
+# Gross income for charts: sum of all income incl. non-cash and other income.
+_gross_income_full = cents_sum(
+    "base_salary",
+    "performance_salary",
+    *_NET_ALLOWANCES,
+    "meal_allowance",
+    *_BENEFITS,
+    "other_income",
+)
 
+_base_salary = cents_getter("base_salary")
+_performance_salary = cents_getter("performance_salary")
+_other_income = cents_getter("other_income")
+_benefit_fields = {
+    name: cents_getter(name) for name in ("meal_allowance", *_BENEFITS)
+}
+_deduction_fields = [(name, cents_getter(name)) for name in _DEDUCTIONS]
+
+# Response values read per record, straight from the registry
+_composition_values = float_fields(
+    n for n in schema_fields(IncomeComposition)
+    if n not in ("base_salary", "performance_salary", "other_income")
+)
+_monthly_table_values = float_fields(schema_fields(MonthlyTableRow))
+_meal_and_other = cents_sum("meal_allowance", "other_income")
 
-def _unified_net_income(r: SalaryRecord) -> Decimal:
-    """Net income according to unified spec:
-    net = base + performance + high + low + computer - (all deductions)
-    Note: excludes meal/benefits and excludes other_income and tax.
-    """
-    return (
-        _D(r.base_salary)
-        + _D(r.performance_salary)
-        + _allowances_sum_net(r)
-        - _deductions_sum(r)
-    )
+# Legacy columns the SQL-aggregated tables report as zero
+_ANNUAL_ZEROS = {
+    f"{name}_total": 0.0
+    for name in schema_fields(AnnualTableRow, "_total")
+    if name in ZERO_FIELDS
+}
+_ANNUAL_MONTHLY_ZEROS = {
+    name: 0.0 for name in schema_fields(AnnualMonthlyRow) if name in ZERO_FIELDS
+}
 
 
-def _gross_income_full(r: SalaryRecord) -> Decimal:
-    """Gross income for charts: sum of all income incl. non-cash and other income."""
-    return (
-        _D(r.base_salary)
-        + _D(r.performance_salary)
-        + _allowances_sum_full(r)
-        + _benefits_sum(r)
-        + _D(_F(r, "other_income"))
-    )
+def _is_empty(agg: Dict[str, Decimal]) -> bool:
+    """Check if a month's aggregation is empty (tax is not shown in the table)."""
+    return all(agg[col] == 0 for col in SALARY_COLUMNS if col != "tax")
 
 
 def _ym_num(y: int, m: int) -> int:
@@ -189,212 +211,180 @@ def _parse_range(range_str: str) -> (int, int):
     return (_ym_num(y1, m1), _ym_num(y2, m2))
 
 
-def _apply_range(
-    recs: List[SalaryRecord],
-    range_str: Optional[str],
-) -> List[SalaryRecord]:
+def _range_bounds(range_str: Optional[str]) -> Optional[YMRange]:
+    """Inclusive ((year, month), (year, month)) bounds, or None for no filter."""
     if not range_str:
-        return recs
+        return None
     start_num, end_num = _parse_range(range_str)
-    return [r for r in recs if start_num <= _ym_num(r.year, r.month) <= end_num]
+    return divmod(start_num, 100), divmod(end_num, 100)
 
 
-def _salary_query(
-    user_id: int,
-    person_id: Optional[int] = None,
-    year: Optional[int] = None,
-    month: Optional[int] = None,
-):
-    q = SalaryRecord.filter(person__user_id=user_id)
-    if person_id:
-        q = q.filter(person_id=person_id)
-    if year:
-        q = q.filter(year=year)
-    if month:
-        q = q.filter(month=month)
-    return q
-
-
-def _payroll_args(r: SalaryRecord, custom_fields: Optional[List[dict]]):
-    return dict(
-        base_salary=r.base_salary,
-        performance_salary=r.performance_salary,
-        high_temp_allowance=_F(r, "high_temp_allowance"),
-        low_temp_allowance=_F(r, "low_temp_allowance"),
-        computer_allowance=_F(r, "computer_allowance"),
-        meal_allowance=_F(r, "meal_allowance"),
-        mid_autumn_benefit=_F(r, "mid_autumn_benefit"),
-        dragon_boat_benefit=_F(r, "dragon_boat_benefit"),
-        spring_festival_benefit=_F(r, "spring_festival_benefit"),
-        other_income=_F(r, "other_income"),
-        comprehensive_allowance=_F(r, "comprehensive_allowance"),
-        pension_insurance=r.pension_insurance,
-        medical_insurance=r.medical_insurance,
-        unemployment_insurance=r.unemployment_insurance,
-        critical_illness_insurance=r.critical_illness_insurance,
-        enterprise_annuity=r.enterprise_annuity,
-        housing_fund=r.housing_fund,
-        other_deductions=_F(r, "other_deductions"),
-        labor_union_fee=_F(r, "labor_union_fee"),
-        performance_deduction=_F(r, "performance_deduction"),
-        tax=r.tax,
-        custom_fields=custom_fields or [],
+def _range_q(bounds: YMRange) -> Q:
+    """Compound (year, month) predicate usable by the (person, year, month) index."""
+    (y1, m1), (y2, m2) = bounds
+    return (
+        Q(year__gte=y1)
+        & Q(year__lte=y2)
+        & (Q(year__gt=y1) | Q(month__gte=m1))
+        & (Q(year__lt=y2) | Q(month__lte=m2))
     )
 
 
+class StatsContext:
+    """Data shared by the stats series computed for one request.
+
+    Series whose effective filter is the same reuse one record load and one
+    custom value load; ``/batch`` runs many series against one context.
+    """
+
+    def __init__(self, user) -> None:
+        self.user = user
+        self._person_names: Optional[Dict[int, str]] = None
+        self._records: Dict[tuple, List[SalaryRow]] = {}
+        self._custom: Dict[tuple, Dict[int, List[dict]]] = {}
+
+    async def person_names(self) -> Dict[int, str]:
+        """``{person_id: name}`` for the user's persons, in storage order."""
+        if self._person_names is None:
+            self._person_names = dict(
+                await Person.filter(user_id=self.user.id).values_list("id", "name")
+            )
+        return self._person_names
+
+    async def records(
+        self,
+        person_id: Optional[int] = None,
+        year: Optional[int] = None,
+        month: Optional[int] = None,
+        range_str: Optional[str] = None,
+    ) -> List[SalaryRow]:
+        key = (person_id, year, month, range_str)
+        if key not in self._records:
+            self._records[key] = await load_salary_rows(
+                self.user.id,
+                person_id=person_id,
+                year=year,
+                month=month,
+                ym_range=_range_bounds(range_str),
+            )
+        return self._records[key]
+
+    async def custom_payroll(
+        self,
+        person_id: Optional[int] = None,
+        year: Optional[int] = None,
+        month: Optional[int] = None,
+        range_str: Optional[str] = None,
+    ) -> Dict[int, List[dict]]:
+        """Custom field payroll info for the records of the same filter."""
+        key = (person_id, year, month, range_str)
+        if key not in self._custom:
+            recs = await self.records(person_id, year, month, range_str)
+            _, self._custom[key] = await load_custom_values([r.id for r in recs])
+        return self._custom[key]
+
+
+def get_stats_context(user=Depends(get_current_user)) -> StatsContext:
+    return StatsContext(user)
+
+
 @router.get("/monthly", response_model=List[MonthlyStats])
+@cached_stats
 async def monthly_stats(
     user=Depends(get_current_user),
+    ctx: StatsContext = Depends(get_stats_context),
     person_id: Optional[int] = Query(default=None),
     year: Optional[int] = Query(default=None),
     month: Optional[int] = Query(default=None),
 ):
-    q = _salary_query(user.id, person_id=person_id, year=year, month=month)
-    recs = await q.all()
-    custom_payroll_map = await load_custom_fields_for_payroll([r.id for r in recs])
+    recs = await ctx.records(person_id, year, month)
+    custom_payroll_map = await ctx.custom_payroll(person_id, year, month)
+    payroll = compute_payroll_batch(
+        **payroll_inputs(recs, custom_payroll_map, cents=True)
+    )
+    columns = {key: values.tolist() for key, values in payroll.items()}
     result: List[MonthlyStats] = []
-    for r in recs:
-        calc = compute_payroll(**_payroll_args(r, custom_payroll_map.get(r.id)))
-        allowances_total = (
-            _F(r, "high_temp_allowance")
-            + _F(r, "low_temp_allowance")
-            + _F(r, "computer_allowance")
-            + _F(r, "communication_allowance")
-            + _F(r, "comprehensive_allowance")
-        )
-        insurance_total = (
-            r.pension_insurance
-            + r.medical_insurance
-            + r.unemployment_insurance
-            + r.critical_illness_insurance
-            + r.enterprise_annuity
-            + r.housing_fund
-        )
+    for i, r in enumerate(recs):
         result.append(
             MonthlyStats(
                 person_id=r.person_id,
                 year=r.year,
                 month=r.month,
-                base_salary=r.base_salary,
-                performance=r.performance_salary,
-                allowances_total=allowances_total,
+                base_salary=cents_to_float(_base_salary(r)),
+                performance=cents_to_float(_performance_salary(r)),
+                allowances_total=cents_to_float(_allowances_sum_net(r)),
                 bonuses_total=0.0,
-                insurance_total=insurance_total,
-                tax=calc["tax"],
-                gross_income=calc["gross_income"],
-                net_income=calc["net_income"],
-                actual_take_home=calc["actual_take_home"],
-                non_cash_benefits=calc["non_cash_benefits"],
+                insurance_total=cents_to_float(_insurance_sum(r)),
+                tax=cents_to_float(columns["tax"][i]),
+                gross_income=cents_to_float(columns["gross_income"][i]),
+                net_income=cents_to_float(columns["net_income"][i]),
+                actual_take_home=cents_to_float(columns["actual_take_home"][i]),
+                non_cash_benefits=cents_to_float(columns["non_cash_benefits"][i]),
             )
         )
     return result
 
 
 @router.get("/yearly", response_model=List[YearlyStats])
+@cached_stats
 async def yearly_stats(
     user=Depends(get_current_user),
+    ctx: StatsContext = Depends(get_stats_context),
     person_id: Optional[int] = Query(default=None),
     year: int = Query(...),
 ):
-    persons = await Person.filter(user_id=user.id).all()
-    person_ids = {p.id for p in persons}
-    if person_id and person_id not in person_ids:
+    if person_id and person_id not in await ctx.person_names():
         raise HTTPException(status_code=404, detail="人员不存在")
-    if person_id:
-        person_ids = {person_id}
-    recs = await SalaryRecord.filter(person_id__in=list(person_ids), year=year).all()
-    custom_payroll_map = await load_custom_fields_for_payroll([r.id for r in recs])
-    stats_map = {}
-    for r in recs:
-        calc = compute_payroll(**_payroll_args(r, custom_payroll_map.get(r.id)))
-        allowances_total = (
-            _F(r, "high_temp_allowance")
-            + _F(r, "low_temp_allowance")
-            + _F(r, "computer_allowance")
-            + _F(r, "communication_allowance")
-            + _F(r, "comprehensive_allowance")
-        )
-        bonuses_total = (
-            _F(r, "mid_autumn_benefit")
-            + _F(r, "dragon_boat_benefit")
-            + _F(r, "spring_festival_benefit")
-            + _F(r, "other_income")
-        )
-        insurance_total = (
-            r.pension_insurance
-            + r.medical_insurance
-            + r.unemployment_insurance
-            + r.critical_illness_insurance
-            + r.enterprise_annuity
-            + r.housing_fund
-        )
-
-        s = stats_map.get(r.person_id, {
-            "months": 0,
-            "gross": Decimal("0"),
-            "net": Decimal("0"),
-            "insurance": Decimal("0"),
-            "tax": Decimal("0"),
-            "allowances": Decimal("0"),
-            "bonuses": Decimal("0"),
-            "actual_take_home": Decimal("0"),
-            "non_cash_benefits": Decimal("0"),
-        })
-        s["months"] += 1
-        s["gross"] += calc["gross_income"]
-        s["net"] += calc["net_income"]
-        s["insurance"] += insurance_total
-        s["tax"] += calc["tax"]
-        s["allowances"] += allowances_total
-        s["actual_take_home"] += calc["actual_take_home"]
-        s["non_cash_benefits"] += calc["non_cash_benefits"]
-        s["bonuses"] += bonuses_total
-        stats_map[r.person_id] = s
+    sums = await sum_salary_columns(
+        user.id, ("person_id",), person_id=person_id, year=year
+    )
+    customs = await sum_custom_values(
+        user.id, ("person_id",), person_id=person_id, year=year
+    )
     result: List[YearlyStats] = []
-    for pid, s in stats_map.items():
-        avg_net = s["net"] / s["months"] if s["months"] else Decimal("0")
+    for pid, agg in sums.items():
+        calc = payroll_totals(agg, customs.get(pid, EMPTY_CUSTOM))
+        months = agg["months"]
+        avg_net = calc["net_income"] / months if months else Decimal("0")
         result.append(
             YearlyStats(
                 person_id=pid,
                 year=year,
-                months=s["months"],
-                total_gross=s["gross"],
-                total_net=s["net"],
+                months=months,
+                total_gross=calc["gross_income"],
+                total_net=calc["net_income"],
                 avg_net=avg_net,
-                insurance_total=s["insurance"],
-                tax_total=s["tax"],
-                allowances_total=s["allowances"],
-                bonuses_total=s["bonuses"],
-                total_actual_take_home=s["actual_take_home"],
-                total_non_cash_benefits=s["non_cash_benefits"],
+                insurance_total=insurance_total(agg),
+                tax_total=calc["tax"],
+                # Legacy allowance/bonus columns now live in custom fields
+                allowances_total=0.0,
+                bonuses_total=0.0,
+                total_actual_take_home=calc["actual_take_home"],
+                total_non_cash_benefits=calc["non_cash_benefits"],
             )
         )
     return result
 
 
 @router.get("/family", response_model=FamilySummary)
-async def family_summary(user=Depends(get_current_user), year: int = Query(...)):
-    persons = await Person.filter(user_id=user.id).all()
-    person_ids = [p.id for p in persons]
-    recs = await SalaryRecord.filter(person_id__in=person_ids, year=year).all()
-    custom_payroll_map = await load_custom_fields_for_payroll([r.id for r in recs])
+@cached_stats
+async def family_summary(
+    user=Depends(get_current_user),
+    ctx: StatsContext = Depends(get_stats_context),
+    year: int = Query(...),
+):
+    person_ids = list(await ctx.person_names())
+    sums = await sum_salary_columns(user.id, ("person_id",), year=year)
+    customs = await sum_custom_values(user.id, ("person_id",), year=year)
     totals = {pid: Decimal("0") for pid in person_ids}
-    insurance_total = Decimal("0")
+    insurance = Decimal("0")
     tax_total = Decimal("0")
     total_gross = Decimal("0")
     total_net = Decimal("0")
-    for r in recs:
-        calc = compute_payroll(**_payroll_args(r, custom_payroll_map.get(r.id)))
-        insurance_calc = (
-            r.pension_insurance
-            + r.medical_insurance
-            + r.unemployment_insurance
-            + r.critical_illness_insurance
-            + r.enterprise_annuity
-            + r.housing_fund
-        )
-        totals[r.person_id] += calc["net_income"]
-        insurance_total += insurance_calc
+    for pid, agg in sums.items():
+        calc = payroll_totals(agg, customs.get(pid, EMPTY_CUSTOM))
+        totals[pid] += calc["net_income"]
+        insurance += insurance_total(agg)
         tax_total += calc["tax"]
         total_gross += calc["gross_income"]
         total_net += calc["net_income"]
@@ -403,51 +393,35 @@ async def family_summary(user=Depends(get_current_user), year: int = Query(...))
         persons=person_ids,
         total_gross=total_gross,
         total_net=total_net,
-        insurance_total=insurance_total,
+        insurance_total=insurance,
         tax_total=tax_total,
         by_person=totals,
     )
 
 
 @router.get("/cumulative-insurance", response_model=List[PersonCumulativeInsurance])
+@cached_stats
 async def cumulative_insurance(user=Depends(get_current_user)):
     """Get cumulative insurance and housing fund for all persons"""
-    persons = await Person.filter(user_id=user.id).all()
     result: List[PersonCumulativeInsurance] = []
 
-    for person in persons:
-        # Get all salary records for this person
-        recs = await SalaryRecord.filter(person_id=person.id).all()
-
-        # Calculate system totals
-        pension_system = sum(r.pension_insurance for r in recs)
-        medical_system = sum(r.medical_insurance for r in recs)
-        housing_fund_system = sum(r.housing_fund for r in recs)
-
-        # Calculate total = history + system
-        pension_total = Decimal(str(person.pension_history)) + Decimal(
-            str(pension_system)
-        )
-        medical_total = Decimal(str(person.medical_history)) + Decimal(
-            str(medical_system)
-        )
-        housing_fund_total = Decimal(str(person.housing_fund_history)) + Decimal(
-            str(housing_fund_system)
-        )
-
+    for row in await sum_contributions_by_person(user.id):
         result.append(
             PersonCumulativeInsurance(
-                person_id=person.id,
-                person_name=person.name,
-                pension_history=person.pension_history,
-                medical_history=person.medical_history,
-                housing_fund_history=person.housing_fund_history,
-                pension_system=pension_system,
-                medical_system=medical_system,
-                housing_fund_system=housing_fund_system,
-                pension_total=pension_total,
-                medical_total=medical_total,
-                housing_fund_total=housing_fund_total,
+                person_id=row["id"],
+                person_name=row["name"],
+                pension_history=row["pension_history"],
+                medical_history=row["medical_history"],
+                housing_fund_history=row["housing_fund_history"],
+                pension_system=row["pension_insurance"],
+                medical_system=row["medical_insurance"],
+                housing_fund_system=row["housing_fund"],
+                # total = history + system
+                pension_total=row["pension_history"] + row["pension_insurance"],
+                medical_total=row["medical_history"] + row["medical_insurance"],
+                housing_fund_total=(
+                    row["housing_fund_history"] + row["housing_fund"]
+                ),
             )
         )
 
@@ -455,33 +429,26 @@ async def cumulative_insurance(user=Depends(get_current_user)):
 
 
 @router.get("/benefits", response_model=List[BenefitStats])
+@cached_stats
 async def benefit_stats(
     user=Depends(get_current_user),
+    ctx: StatsContext = Depends(get_stats_context),
     person_id: Optional[int] = Query(default=None),
     year: Optional[int] = Query(default=None),
 ):
     """Get non-cash benefit statistics"""
-    q = _salary_query(user.id, person_id=person_id, year=year)
-    recs = await q.all()
+    recs = await ctx.records(person_id, year)
     result: List[BenefitStats] = []
 
     for r in recs:
-        total_benefits = (
-            _F(r, "meal_allowance")
-            + _F(r, "mid_autumn_benefit")
-            + _F(r, "dragon_boat_benefit")
-            + _F(r, "spring_festival_benefit")
-        )
+        amounts = {name: get(r) for name, get in _benefit_fields.items()}
         result.append(
             BenefitStats(
                 year=r.year,
                 month=r.month,
                 person_id=r.person_id,
-                meal_allowance=_F(r, "meal_allowance"),
-                mid_autumn_benefit=_F(r, "mid_autumn_benefit"),
-                dragon_boat_benefit=_F(r, "dragon_boat_benefit"),
-                spring_festival_benefit=_F(r, "spring_festival_benefit"),
-                total_benefits=total_benefits,
+                **{name: cents_to_float(c) for name, c in amounts.items()},
+                total_benefits=cents_to_float(sum(amounts.values())),
             )
         )
 
@@ -489,8 +456,10 @@ async def benefit_stats(
 
 
 @router.get("/income-composition", response_model=List[IncomeComposition])
+@cached_stats
 async def income_composition(
     user=Depends(get_current_user),
+    ctx: StatsContext = Depends(get_stats_context),
     person_id: Optional[int] = Query(default=None),
     year: Optional[int] = Query(default=None),
     month: Optional[int] = Query(default=None),
@@ -502,68 +471,45 @@ async def income_composition(
     补贴 = 高温补贴 + 低温补贴 + 餐补 + 电脑补贴
     福利 = 中秋福利 + 端午福利 + 春节福利
     """
-    q = _salary_query(user.id, person_id=person_id, year=year, month=month)
-    recs = await q.all()
-
-    recs = _apply_range(recs, range)
+    recs = await ctx.records(person_id, year, month, range)
 
     result: List[IncomeComposition] = []
 
     for r in recs:
-        allowances = float(_allowances_sum_full(r))
-        benefits = float(_benefits_sum(r))
-        total_income = float(
-            _D(r.base_salary)
-            + _D(r.performance_salary)
-            + _D(allowances)
-            + _D(benefits)
-            + _D(_F(r, "other_income"))
+        base_salary = _base_salary(r)
+        performance_salary = _performance_salary(r)
+        allowances = _allowances_sum_full(r)
+        benefits = _benefits_sum(r)
+        other_income = _other_income(r)
+        total_income = (
+            base_salary + performance_salary + allowances + benefits + other_income
         )
-        
+
         # Calculate percentages (avoid division by zero)
         if total_income > 0:
-            base_salary_percent = float(
-                _D(r.base_salary) / _D(total_income) * 100
-            )
-            performance_percent = float(
-                _D(r.performance_salary) / _D(total_income) * 100
-            )
-            allowances_percent = float(
-                _D(allowances) / _D(total_income) * 100
-            )
-            benefits_percent = float(
-                _D(benefits) / _D(total_income) * 100
-            )
-            other_percent = float(
-                _D(_F(r, "other_income")) / _D(total_income) * 100
-            )
+            base_salary_percent = cents_percent(base_salary, total_income)
+            performance_percent = cents_percent(performance_salary, total_income)
+            allowances_percent = cents_percent(allowances, total_income)
+            benefits_percent = cents_percent(benefits, total_income)
+            other_percent = cents_percent(other_income, total_income)
         else:
             base_salary_percent = 0.0
             performance_percent = 0.0
             allowances_percent = 0.0
             benefits_percent = 0.0
             other_percent = 0.0
-        
+
         result.append(
             IncomeComposition(
                 person_id=r.person_id,
                 year=r.year,
                 month=r.month,
-                base_salary=float(_D(r.base_salary)),
-                performance_salary=float(_D(r.performance_salary)),
-                high_temp_allowance=float(_D(_F(r, "high_temp_allowance"))),
-                low_temp_allowance=float(_D(_F(r, "low_temp_allowance"))),
-                computer_allowance=float(_D(_F(r, "computer_allowance"))),
-                communication_allowance=float(
-                    _D(_F(r, "communication_allowance"))
-                ),
-                comprehensive_allowance=float(
-                    _D(_F(r, "comprehensive_allowance"))
-                ),
-                meal_allowance=float(_D(_F(r, "meal_allowance"))),
-                other_income=float(_D(_F(r, "other_income"))),
-                non_cash_benefits=float(_D(benefits)),
-                total_income=total_income,
+                base_salary=cents_to_float(base_salary),
+                performance_salary=cents_to_float(performance_salary),
+                **_composition_values(r),
+                other_income=cents_to_float(other_income),
+                non_cash_benefits=cents_to_float(benefits),
+                total_income=cents_to_float(total_income),
                 base_salary_percent=base_salary_percent,
                 performance_percent=performance_percent,
                 allowances_percent=allowances_percent,
@@ -576,6 +522,7 @@ async def income_composition(
 
 
 @router.get("/net-income/monthly", response_model=List[MonthlyNetIncome])
+@cached_stats
 async def net_income_monthly(
     user=Depends(get_current_user),
     year: Optional[int] = Query(default=None),
@@ -585,23 +532,24 @@ async def net_income_monthly(
     ),
 ):
     """Monthly net income series (unified calculation)."""
-    q = _salary_query(user.id, person_id=person_id, year=year)
-    recs = _apply_range(await q.all(), range)
-
-    sums = {}
-    for r in recs:
-        key = (r.year, r.month)
-        sums[key] = sums.get(key, Decimal("0")) + _unified_net_income(r)
+    sums = await sum_rollups(
+        user.id,
+        ("year", "month"),
+        person_id=person_id,
+        year=year,
+        ym_range=_range_bounds(range),
+    )
 
     result: List[MonthlyNetIncome] = []
-    for (y, m) in sorted(sums.keys()):
+    for (y, m), agg in sums.items():
         result.append(
-            MonthlyNetIncome(year=y, month=m, net_income=float(sums[(y, m)]))
+            MonthlyNetIncome(year=y, month=m, net_income=float(agg["net_income"]))
         )
     return result
 
 
 @router.get("/gross-vs-net/monthly", response_model=List[GrossVsNetMonthly])
+@cached_stats
 async def gross_vs_net_monthly(
     user=Depends(get_current_user),
     year: Optional[int] = Query(default=None),
@@ -616,32 +564,34 @@ async def gross_vs_net_monthly(
     （排除：餐补、三节福利）
     实际到手 = 应发 - 扣除
     """
-    q = _salary_query(user.id, person_id=person_id, year=year)
-    recs = _apply_range(await q.all(), range)
-
-    sums = {}
-    for r in recs:
-        key = (r.year, r.month)
-        gross = _gross_income_for_net_charts(r)
-        deductions = _deductions_sum(r)
-        net = gross - deductions  # For waterfall: net = gross - deductions
-        prev_g, prev_n = sums.get(key, (Decimal("0"), Decimal("0")))
-        sums[key] = (prev_g + gross, prev_n + net)
+    sums = await sum_rollups(
+        user.id,
+        ("year", "month"),
+        person_id=person_id,
+        year=year,
+        ym_range=_range_bounds(range),
+    )
 
     result: List[GrossVsNetMonthly] = []
-    for (y, m) in sorted(sums.keys()):
-        g, n = sums[(y, m)]
+    for (y, m), agg in sums.items():
+        # For waterfall: net = gross - deductions
+        gross = agg["net_income"] + agg["deductions_total"]
         result.append(
             GrossVsNetMonthly(
-                year=y, month=m, gross_income=float(g), net_income=float(n)
+                year=y,
+                month=m,
+                gross_income=float(gross),
+                net_income=float(agg["net_income"]),
             )
         )
     return result
 
 
 @router.get("/deductions/breakdown", response_model=DeductionsBreakdown)
+@cached_stats
 async def deductions_breakdown(
     user=Depends(get_current_user),
+    ctx: StatsContext = Depends(get_stats_context),
     person_id: Optional[int] = Query(default=None),
     year: Optional[int] = Query(default=None),
     month: Optional[int] = Query(default=None),
@@ -652,8 +602,7 @@ async def deductions_breakdown(
     """Breakdown of deduction categories with monthly series and percentage share.
     支持按人员、年份、月份过滤；为兼容性保留 range，但前端已不使用。
     """
-    q = _salary_query(user.id, person_id=person_id, year=year, month=month)
-    recs = _apply_range(await q.all(), range)
+    recs = await ctx.records(person_id, year, month, range)
 
     # Summary totals by category
     categories = [
@@ -668,19 +617,19 @@ async def deductions_breakdown(
         ("绩效扣除", "performance_deduction"),
     ]
 
-    totals = {key: Decimal("0") for _, key in categories}
+    totals = {key: 0 for _, key in categories}
     for r in recs:
-        for _, key in categories:
-            totals[key] += _D(_F(r, key))
+        for key, get in _deduction_fields:
+            totals[key] += get(r)
 
-    grand_total = sum(totals.values()) if totals else Decimal("0")
+    grand_total = sum(totals.values())
     summary: List[DeductionsBreakdownItem] = []
     for name, key in categories:
         amount = totals[key]
-        percent = float((amount / grand_total * 100) if grand_total > 0 else 0)
+        percent = cents_percent(amount, grand_total) if grand_total > 0 else 0.0
         summary.append(
             DeductionsBreakdownItem(
-                category=name, amount=float(amount), percent=percent
+                category=name, amount=cents_to_float(amount), percent=percent
             )
         )
 
@@ -689,9 +638,9 @@ async def deductions_breakdown(
     for r in recs:
         k = (r.year, r.month)
         if k not in monthly_map:
-            monthly_map[k] = {key: Decimal("0") for _, key in categories}
-        for _, key in categories:
-            monthly_map[k][key] += _D(_F(r, key))
+            monthly_map[k] = {key: 0 for _, key in categories}
+        for key, get in _deduction_fields:
+            monthly_map[k][key] += get(r)
 
     monthly: List[DeductionsMonthly] = []
     for (y, m) in sorted(monthly_map.keys()):
@@ -701,18 +650,18 @@ async def deductions_breakdown(
             DeductionsMonthly(
                 year=y,
                 month=m,
-                pension_insurance=float(data["pension_insurance"]),
-                medical_insurance=float(data["medical_insurance"]),
-                unemployment_insurance=float(data["unemployment_insurance"]),
-                critical_illness_insurance=float(
+                pension_insurance=cents_to_float(data["pension_insurance"]),
+                medical_insurance=cents_to_float(data["medical_insurance"]),
+                unemployment_insurance=cents_to_float(data["unemployment_insurance"]),
+                critical_illness_insurance=cents_to_float(
                     data["critical_illness_insurance"]
                 ),
-                enterprise_annuity=float(data["enterprise_annuity"]),
-                housing_fund=float(data["housing_fund"]),
-                other_deductions=float(data["other_deductions"]),
-                labor_union_fee=float(data["labor_union_fee"]),
-                performance_deduction=float(data["performance_deduction"]),
-                total=float(total),
+                enterprise_annuity=cents_to_float(data["enterprise_annuity"]),
+                housing_fund=cents_to_float(data["housing_fund"]),
+                other_deductions=cents_to_float(data["other_deductions"]),
+                labor_union_fee=cents_to_float(data["labor_union_fee"]),
+                performance_deduction=cents_to_float(data["performance_deduction"]),
+                total=cents_to_float(total),
             )
         )
 
@@ -720,6 +669,7 @@ async def deductions_breakdown(
 
 
 @router.get("/contributions/cumulative", response_model=ContributionsCumulative)
+@cached_stats
 async def contributions_cumulative(
     user=Depends(get_current_user),
     person_id: int = Query(..., description="人员ID"),
@@ -727,58 +677,41 @@ async def contributions_cumulative(
         default=None, description="时间范围，如 2024-01..2024-12"
     ),
 ):
-    """Cumulative lines for pension/medical/housing fund, with history."""
+    """Cumulative lines for pension/medical/housing fund, with history.
+
+    Served from the per-person prefix-sum index: each point is the person's
+    history plus the running system total at that month.
+    """
     person = await Person.get_or_none(id=person_id, user_id=user.id)
     if not person:
         raise HTTPException(status_code=404, detail="人员不存在")
 
-    all_recs = await SalaryRecord.filter(person_id=person_id).all()
-    all_recs.sort(key=lambda r: _ym_num(r.year, r.month))
-
-    if range:
-        start_num, end_num = _parse_range(range)
-    else:
-        start_num, end_num = (0, 999999)
-
-    # Base offsets include history plus any system amounts before the range start
-    base_pension = _D(person.pension_history)
-    base_medical = _D(person.medical_history)
-    base_housing = _D(person.housing_fund_history)
-
-    for r in all_recs:
-        ym = _ym_num(r.year, r.month)
-        if ym < start_num:
-            base_pension += _D(r.pension_insurance)
-            base_medical += _D(r.medical_insurance)
-            base_housing += _D(r.housing_fund)
+    index = ContributionIndex.filter(person_id=person_id)
+    columns = ("year", "month", "pension_cents", "medical_cents", "housing_fund_cents")
 
     # Iterate points inside range
-    points: List[ContributionsCumulativePoint] = []
-    cur_p = base_pension
-    cur_m = base_medical
-    cur_h = base_housing
-
-    for r in all_recs:
-        ym = _ym_num(r.year, r.month)
-        if ym < start_num or ym > end_num:
-            continue
-        cur_p += _D(r.pension_insurance)
-        cur_m += _D(r.medical_insurance)
-        cur_h += _D(r.housing_fund)
-        points.append(
-            ContributionsCumulativePoint(
-                year=r.year,
-                month=r.month,
-                pension_cumulative=float(cur_p),
-                medical_cumulative=float(cur_m),
-                housing_fund_cumulative=float(cur_h),
-            )
+    bounds = _range_bounds(range)
+    in_range = index.filter(_range_q(bounds)) if bounds else index
+    rows = await in_range.order_by("year", "month").values_list(*columns)
+
+    base_pension = to_cents(person.pension_history)
+    base_medical = to_cents(person.medical_history)
+    base_housing = to_cents(person.housing_fund_history)
+
+    points: List[ContributionsCumulativePoint] = [
+        ContributionsCumulativePoint(
+            year=y,
+            month=m,
+            pension_cumulative=cents_to_float(base_pension + p),
+            medical_cumulative=cents_to_float(base_medical + med),
+            housing_fund_cumulative=cents_to_float(base_housing + h),
         )
+        for y, m, p, med, h in rows
+    ]
 
-    # Totals over entire dataset (history + system)
-    pension_system_total = float(sum(_D(r.pension_insurance) for r in all_recs))
-    medical_system_total = float(sum(_D(r.medical_insurance) for r in all_recs))
-    housing_system_total = float(sum(_D(r.housing_fund) for r in all_recs))
+    # Totals over entire dataset (history + system) come from the last row
+    last = await index.order_by("-year", "-month").first().values_list(*columns)
+    _, _, p_total, m_total, h_total = last or (0, 0, 0, 0, 0)
 
     return ContributionsCumulative(
         person_id=person.id,
@@ -787,229 +720,126 @@ async def contributions_cumulative(
         medical_history=person.medical_history,
         housing_fund_history=person.housing_fund_history,
         points=points,
-        pension_system_total=pension_system_total,
-        medical_system_total=medical_system_total,
-        housing_fund_system_total=housing_system_total,
-        pension_total=float(_D(person.pension_history) + _D(pension_system_total)),
-        medical_total=float(_D(person.medical_history) + _D(medical_system_total)),
-        housing_fund_total=float(
-            _D(person.housing_fund_history) + _D(housing_system_total)
-        ),
+        pension_system_total=cents_to_float(p_total),
+        medical_system_total=cents_to_float(m_total),
+        housing_fund_system_total=cents_to_float(h_total),
+        pension_total=cents_to_float(base_pension + p_total),
+        medical_total=cents_to_float(base_medical + m_total),
+        housing_fund_total=cents_to_float(base_housing + h_total),
+    )
+
+
+def _monthly_table_row(r: SalaryRow, persons: Dict[int, str]) -> MonthlyTableRow:
+    net = _unified_net_income(r)
+    return MonthlyTableRow(
+        person_id=r.person_id,
+        person_name=persons.get(r.person_id, str(r.person_id)),
+        year=r.year,
+        month=r.month,
+        **_monthly_table_values(r),
+        # totals
+        income_total=cents_to_float(_gross_income_full(r)),
+        deductions_total=cents_to_float(_deductions_sum(r)),
+        benefits_total=cents_to_float(_benefits_sum(r)),
+        allowances_total=cents_to_float(_meal_and_other(r)),
+        actual_take_home=cents_to_float(net),
+        net_income=cents_to_float(net),
+        note=r.note,
     )
 
 
 @router.get("/tables/monthly", response_model=List[MonthlyTableRow])
 async def monthly_table(
     user=Depends(get_current_user),
+    ctx: StatsContext = Depends(get_stats_context),
     person_id: Optional[int] = Query(default=None),
     year: Optional[int] = Query(default=None),
     month: Optional[int] = Query(default=None),
     range: Optional[str] = Query(default=None),
+    stream: bool = Query(default=False, description="以 NDJSON 流式返回"),
+    accept: Optional[str] = Header(default=None),
 ):
     """Monthly detail table: income items, deduction subtotal, net income (unified),
     benefits total, note.
     支持按人员、年份、月份过滤；为兼容性保留 range，但前端已不使用。
-    """
-    q = _salary_query(user.id, person_id=person_id, year=year, month=month)
-    recs = _apply_range(await q.all(), range)
-
-    # Load person names
-    persons = {p.id: p.name for p in await Person.filter(user_id=user.id).all()}
 
-    rows: List[MonthlyTableRow] = []
-    for r in sorted(recs, key=lambda x: (x.year, x.month, x.person_id)):
-        benefits = _benefits_sum(r)
-        deductions = _deductions_sum(r)
-        net = _unified_net_income(r)
-        income_total = _gross_income_full(r)
-        rows.append(
-            MonthlyTableRow(
-                person_id=r.person_id,
-                person_name=persons.get(r.person_id, str(r.person_id)),
-                year=r.year,
-                month=r.month,
-                # incomes
-                base_salary=float(_D(r.base_salary)),
-                performance_salary=float(_D(r.performance_salary)),
-                high_temp_allowance=float(_D(_F(r, "high_temp_allowance"))),
-                low_temp_allowance=float(_D(_F(r, "low_temp_allowance"))),
-                computer_allowance=float(_D(_F(r, "computer_allowance"))),
-                communication_allowance=float(
-                    _D(_F(r, "communication_allowance"))
-                ),
-                comprehensive_allowance=float(
-                    _D(_F(r, "comprehensive_allowance"))
-                ),
-                meal_allowance=float(_D(_F(r, "meal_allowance"))),
-                mid_autumn_benefit=float(_D(_F(r, "mid_autumn_benefit"))),
-                dragon_boat_benefit=float(_D(_F(r, "dragon_boat_benefit"))),
-                spring_festival_benefit=float(
-                    _D(_F(r, "spring_festival_benefit"))
-                ),
-                other_income=float(_D(_F(r, "other_income"))),
-                # deductions
-                pension_insurance=float(_D(r.pension_insurance)),
-                medical_insurance=float(_D(r.medical_insurance)),
-                unemployment_insurance=float(_D(r.unemployment_insurance)),
-                critical_illness_insurance=float(
-                    _D(r.critical_illness_insurance)
-                ),
-                enterprise_annuity=float(_D(r.enterprise_annuity)),
-                housing_fund=float(_D(r.housing_fund)),
-                other_deductions=float(_D(_F(r, "other_deductions"))),
-                labor_union_fee=float(_D(_F(r, "labor_union_fee"))),
-                performance_deduction=float(
-                    _D(_F(r, "performance_deduction"))
-                ),
-                # totals
-                income_total=float(income_total),
-                deductions_total=float(deductions),
-                benefits_total=float(benefits),
-                allowances_total=float(
-                    _D(_F(r, "meal_allowance")) + _D(_F(r, "other_income"))
-                ),
-                actual_take_home=float(net),
-                net_income=float(net),
-                tax=float(_D(r.tax)),
-                note=r.note,
-            )
+    With ``stream=1`` or ``Accept: application/x-ndjson`` the rows are
+    streamed as NDJSON while they are read, bypassing the stats cache.
+    """
+    if wants_ndjson(accept, stream):
+        persons = await ctx.person_names()
+        chunks = iter_salary_rows(
+            user.id,
+            STREAM_CHUNK_SIZE,
+            person_id=person_id,
+            year=year,
+            month=month,
+            ym_range=_range_bounds(range),
+        )
+        return ndjson_response(
+            [_monthly_table_row(r, persons) for r in chunk] async for chunk in chunks
         )
+    return await _monthly_table(
+        user=user, ctx=ctx, person_id=person_id, year=year, month=month, range=range
+    )
 
-    return rows
+
+@cached_stats
+async def _monthly_table(
+    user, ctx: StatsContext, person_id, year, month, range
+) -> List[MonthlyTableRow]:
+    recs = await ctx.records(person_id, year, month, range)
+    persons = await ctx.person_names()
+    return [
+        _monthly_table_row(r, persons)
+        for r in sorted(recs, key=lambda x: (x.year, x.month, x.person_id))
+    ]
 
 
 @router.get("/tables/annual", response_model=List[AnnualTableRow])
+@cached_stats
 async def annual_table(
     user=Depends(get_current_user),
+    ctx: StatsContext = Depends(get_stats_context),
     year: int = Query(...),
 ):
     """Annual summary table per person with YoY growth based on unified net income."""
-    persons = await Person.filter(user_id=user.id).all()
-    person_ids = [p.id for p in persons]
-    name_map = {p.id: p.name for p in persons}
-
-    recs = await SalaryRecord.filter(person_id__in=person_ids, year=year).all()
-
-    # Current year aggregates across all fixed fields
-    agg = {}
-    for r in recs:
-        pid = r.person_id
-        cur = agg.get(pid, {
-            # income items
-            "base_salary": Decimal("0"),
-            "performance_salary": Decimal("0"),
-            "high_temp_allowance": Decimal("0"),
-            "low_temp_allowance": Decimal("0"),
-            "computer_allowance": Decimal("0"),
-            "communication_allowance": Decimal("0"),
-            "meal_allowance": Decimal("0"),
-            "mid_autumn_benefit": Decimal("0"),
-            "dragon_boat_benefit": Decimal("0"),
-            "spring_festival_benefit": Decimal("0"),
-            "other_income": Decimal("0"),
-            # deduction items
-            "pension_insurance": Decimal("0"),
-            "medical_insurance": Decimal("0"),
-            "unemployment_insurance": Decimal("0"),
-            "critical_illness_insurance": Decimal("0"),
-            "enterprise_annuity": Decimal("0"),
-            "housing_fund": Decimal("0"),
-            "other_deductions": Decimal("0"),
-            "labor_union_fee": Decimal("0"),
-            "performance_deduction": Decimal("0"),
-            # derived totals
-            "income_total": Decimal("0"),
-            "deductions_total": Decimal("0"),
-            "benefits_total": Decimal("0"),
-            "actual_take_home_total": Decimal("0"),
-            "net": Decimal("0"),
-        })
-        # accumulate incomes
-        cur["base_salary"] += _D(r.base_salary)
-        cur["performance_salary"] += _D(r.performance_salary)
-        cur["high_temp_allowance"] += _D(_F(r, "high_temp_allowance"))
-        cur["low_temp_allowance"] += _D(_F(r, "low_temp_allowance"))
-        cur["computer_allowance"] += _D(_F(r, "computer_allowance"))
-        cur["communication_allowance"] += _D(_F(r, "communication_allowance"))
-        cur["meal_allowance"] += _D(_F(r, "meal_allowance"))
-        cur["mid_autumn_benefit"] += _D(_F(r, "mid_autumn_benefit"))
-        cur["dragon_boat_benefit"] += _D(_F(r, "dragon_boat_benefit"))
-        cur["spring_festival_benefit"] += _D(_F(r, "spring_festival_benefit"))
-        cur["other_income"] += _D(_F(r, "other_income"))
-        # accumulate deductions
-        cur["pension_insurance"] += _D(r.pension_insurance)
-        cur["medical_insurance"] += _D(r.medical_insurance)
-        cur["unemployment_insurance"] += _D(r.unemployment_insurance)
-        cur["critical_illness_insurance"] += _D(r.critical_illness_insurance)
-        cur["enterprise_annuity"] += _D(r.enterprise_annuity)
-        cur["housing_fund"] += _D(r.housing_fund)
-        cur["other_deductions"] += _D(_F(r, "other_deductions"))
-        cur["labor_union_fee"] += _D(_F(r, "labor_union_fee"))
-        cur["performance_deduction"] += _D(_F(r, "performance_deduction"))
-        # derived
-        cur["income_total"] += _gross_income_full(r)
-        cur["deductions_total"] += _deductions_sum(r)
-        b_total = _benefits_sum(r)
-        cur["benefits_total"] += b_total
-        n = _unified_net_income(r)
-        cur["actual_take_home_total"] += n
-        cur["net"] += n
-        agg[pid] = cur
+    name_map = await ctx.person_names()
 
+    cur_sums = await sum_salary_columns(user.id, ("person_id",), year=year)
     # Previous year nets for YoY
-    prev_recs = await SalaryRecord.filter(
-        person_id__in=person_ids, year=year - 1
-    ).all()
-    prev_net = {}
-    for r in prev_recs:
-        prev_net[r.person_id] = prev_net.get(
-            r.person_id, Decimal("0")
-        ) + _unified_net_income(r)
+    prev_sums = await sum_salary_columns(user.id, ("person_id",), year=year - 1)
 
     rows: List[AnnualTableRow] = []
-    for pid, cur in agg.items():
-        pn = prev_net.get(pid, Decimal("0"))
-        yoy = float(((cur["net"] - pn) / pn * 100)) if pn > 0 else None
+    for pid, agg in cur_sums.items():
+        totals = unified_totals(agg)
+        prev = prev_sums.get(pid)
+        pn = unified_totals(prev)["net_income"] if prev else Decimal("0")
+        yoy = float(((totals["net_income"] - pn) / pn * 100)) if pn > 0 else None
         rows.append(
             AnnualTableRow(
                 person_id=pid,
                 person_name=name_map.get(pid, str(pid)),
                 year=year,
                 # income totals
-                base_salary_total=float(cur["base_salary"]),
-                performance_salary_total=float(cur["performance_salary"]),
-                high_temp_allowance_total=float(cur["high_temp_allowance"]),
-                low_temp_allowance_total=float(cur["low_temp_allowance"]),
-                computer_allowance_total=float(cur["computer_allowance"]),
-                communication_allowance_total=float(
-                    cur["communication_allowance"]
-                ),
-                meal_allowance_total=float(cur["meal_allowance"]),
-                mid_autumn_benefit_total=float(cur["mid_autumn_benefit"]),
-                dragon_boat_benefit_total=float(cur["dragon_boat_benefit"]),
-                spring_festival_benefit_total=float(
-                    cur["spring_festival_benefit"]
-                ),
-                other_income_total=float(cur["other_income"]),
+                base_salary_total=float(agg["base_salary"]),
+                performance_salary_total=float(agg["performance_salary"]),
                 # deduction totals
-                pension_insurance_total=float(cur["pension_insurance"]),
-                medical_insurance_total=float(cur["medical_insurance"]),
-                unemployment_insurance_total=float(cur["unemployment_insurance"]),
+                pension_insurance_total=float(agg["pension_insurance"]),
+                medical_insurance_total=float(agg["medical_insurance"]),
+                unemployment_insurance_total=float(agg["unemployment_insurance"]),
                 critical_illness_insurance_total=float(
-                    cur["critical_illness_insurance"]
-                ),
-                enterprise_annuity_total=float(cur["enterprise_annuity"]),
-                housing_fund_total=float(cur["housing_fund"]),
-                other_deductions_total=float(cur["other_deductions"]),
-                labor_union_fee_total=float(cur["labor_union_fee"]),
-                performance_deduction_total=float(
-                    cur["performance_deduction"]
+                    agg["critical_illness_insurance"]
                 ),
+                enterprise_annuity_total=float(agg["enterprise_annuity"]),
+                housing_fund_total=float(agg["housing_fund"]),
+                # legacy allowance/benefit columns (now custom fields)
+                **_ANNUAL_ZEROS,
                 # grand totals
-                income_total=float(cur["income_total"]),
-                deductions_total=float(cur["deductions_total"]),
-                benefits_total=float(cur["benefits_total"]),
-                actual_take_home_total=float(cur["actual_take_home_total"]),
+                income_total=float(totals["income_total"]),
+                deductions_total=float(totals["deductions_total"]),
+                benefits_total=float(totals["benefits_total"]),
+                actual_take_home_total=float(totals["net_income"]),
                 yoy_growth=yoy,
             )
         )
@@ -1020,8 +850,10 @@ async def annual_table(
 
 
 @router.get("/tables/annual-monthly", response_model=List[AnnualMonthlyRow])
+@cached_stats
 async def annual_monthly_table(
     user=Depends(get_current_user),
+    ctx: StatsContext = Depends(get_stats_context),
     year: int = Query(...),
     person_id: Optional[int] = Query(default=None),
     hide_empty: bool = Query(default=False, description="Hide months with no data"),
@@ -1031,116 +863,33 @@ async def annual_monthly_table(
     Shows all fixed fields summed across all persons (or filtered person).
     If hide_empty=true, only returns months with actual data.
     """
-    persons = await Person.filter(user_id=user.id).all()
-    person_ids = [p.id for p in persons]
-
     if person_id:
-        if person_id not in person_ids:
+        if person_id not in await ctx.person_names():
             raise HTTPException(status_code=404, detail="人员不存在")
-        person_ids = [person_id]
-
-    recs = await SalaryRecord.filter(person_id__in=person_ids, year=year).all()
-
-    # Aggregate by month (1-12)
-    monthly_agg = {}
-    for m in range(1, 13):
-        monthly_agg[m] = {
-            "base_salary": Decimal("0"),
-            "performance_salary": Decimal("0"),
-            "high_temp_allowance": Decimal("0"),
-            "low_temp_allowance": Decimal("0"),
-            "computer_allowance": Decimal("0"),
-            "communication_allowance": Decimal("0"),
-            "comprehensive_allowance": Decimal("0"),
-            "meal_allowance": Decimal("0"),
-            "mid_autumn_benefit": Decimal("0"),
-            "dragon_boat_benefit": Decimal("0"),
-            "spring_festival_benefit": Decimal("0"),
-            "other_income": Decimal("0"),
-            "pension_insurance": Decimal("0"),
-            "medical_insurance": Decimal("0"),
-            "unemployment_insurance": Decimal("0"),
-            "critical_illness_insurance": Decimal("0"),
-            "enterprise_annuity": Decimal("0"),
-            "housing_fund": Decimal("0"),
-            "other_deductions": Decimal("0"),
-            "labor_union_fee": Decimal("0"),
-            "performance_deduction": Decimal("0"),
-            "income_total": Decimal("0"),
-            "deductions_total": Decimal("0"),
-            "benefits_total": Decimal("0"),
-            "actual_take_home": Decimal("0"),
-        }
 
-    for r in recs:
-        m = r.month
-        agg = monthly_agg[m]
-
-        # Accumulate income fields
-        agg["base_salary"] += _D(r.base_salary)
-        agg["performance_salary"] += _D(r.performance_salary)
-        agg["high_temp_allowance"] += _D(_F(r, "high_temp_allowance"))
-        agg["low_temp_allowance"] += _D(_F(r, "low_temp_allowance"))
-        agg["computer_allowance"] += _D(_F(r, "computer_allowance"))
-        agg["communication_allowance"] += _D(_F(r, "communication_allowance"))
-        agg["comprehensive_allowance"] += _D(_F(r, "comprehensive_allowance"))
-        agg["meal_allowance"] += _D(_F(r, "meal_allowance"))
-        agg["mid_autumn_benefit"] += _D(_F(r, "mid_autumn_benefit"))
-        agg["dragon_boat_benefit"] += _D(_F(r, "dragon_boat_benefit"))
-        agg["spring_festival_benefit"] += _D(_F(r, "spring_festival_benefit"))
-        agg["other_income"] += _D(_F(r, "other_income"))
-
-        # Accumulate deduction fields
-        agg["pension_insurance"] += _D(r.pension_insurance)
-        agg["medical_insurance"] += _D(r.medical_insurance)
-        agg["unemployment_insurance"] += _D(r.unemployment_insurance)
-        agg["critical_illness_insurance"] += _D(r.critical_illness_insurance)
-        agg["enterprise_annuity"] += _D(r.enterprise_annuity)
-        agg["housing_fund"] += _D(r.housing_fund)
-        agg["other_deductions"] += _D(_F(r, "other_deductions"))
-        agg["labor_union_fee"] += _D(_F(r, "labor_union_fee"))
-        agg["performance_deduction"] += _D(_F(r, "performance_deduction"))
-
-        # Calculate totals
-        agg["income_total"] += _gross_income_full(r)
-        agg["deductions_total"] += _deductions_sum(r)
-        agg["benefits_total"] += _benefits_sum(r)
-        agg["allowances_total"] = agg.get(
-            "allowances_total", Decimal("0")
-        ) + (_D(_F(r, "meal_allowance")) + _D(_F(r, "other_income")))
-        agg["actual_take_home"] += _unified_net_income(r)
-
-    def is_empty(agg):
-        """Check if a month's aggregation is empty (all zeros)."""
-        return all(agg[k] == Decimal("0") for k in agg.keys())
+    monthly_agg = await sum_salary_columns(
+        user.id, ("month",), person_id=person_id, year=year
+    )
+    monthly_totals = await sum_rollups(
+        user.id, ("month",), person_id=person_id, year=year
+    )
 
     rows: List[AnnualMonthlyRow] = []
     for m in range(1, 13):
-        agg = monthly_agg[m]
+        agg = monthly_agg.get(m)
 
         # Skip empty months if hide_empty is true
-        if hide_empty and is_empty(agg):
+        if agg is None:
+            agg = {col: Decimal("0") for col in SALARY_COLUMNS}
+        if hide_empty and _is_empty(agg):
             continue
-            
+        totals = monthly_totals.get(m) or unified_totals(agg)
+
         rows.append(
             AnnualMonthlyRow(
                 month=m,
                 base_salary=float(agg["base_salary"]),
                 performance_salary=float(agg["performance_salary"]),
-                high_temp_allowance=float(agg["high_temp_allowance"]),
-                low_temp_allowance=float(agg["low_temp_allowance"]),
-                computer_allowance=float(agg["computer_allowance"]),
-                communication_allowance=float(agg["communication_allowance"]),
-                comprehensive_allowance=float(
-                    agg["comprehensive_allowance"]
-                )
-                if "comprehensive_allowance" in agg
-                else 0.0,
-                meal_allowance=float(agg["meal_allowance"]),
-                mid_autumn_benefit=float(agg["mid_autumn_benefit"]),
-                dragon_boat_benefit=float(agg["dragon_boat_benefit"]),
-                spring_festival_benefit=float(agg["spring_festival_benefit"]),
-                other_income=float(agg["other_income"]),
                 pension_insurance=float(agg["pension_insurance"]),
                 medical_insurance=float(agg["medical_insurance"]),
                 unemployment_insurance=float(agg["unemployment_insurance"]),
@@ -1149,21 +898,208 @@ async def annual_monthly_table(
                 ),
                 enterprise_annuity=float(agg["enterprise_annuity"]),
                 housing_fund=float(agg["housing_fund"]),
-                other_deductions=float(agg["other_deductions"]),
-                labor_union_fee=float(agg["labor_union_fee"]),
-                performance_deduction=float(
-                    agg["performance_deduction"]
-                )
-                if "performance_deduction" in agg
-                else 0.0,
-                income_total=float(agg["income_total"]),
-                deductions_total=float(agg["deductions_total"]),
-                benefits_total=float(agg["benefits_total"]),
-                allowances_total=float(
-                    agg.get("allowances_total", Decimal("0"))
-                ),
-                actual_take_home=float(agg["actual_take_home"]),
+                **_ANNUAL_MONTHLY_ZEROS,
+                income_total=float(totals["income_total"]),
+                deductions_total=float(totals["deductions_total"]),
+                benefits_total=float(totals["benefits_total"]),
+                allowances_total=0.0,
+                actual_take_home=float(totals["net_income"]),
             )
         )
 
     return rows
+
+
+# Spreadsheet exports of the three tables. Columns are the table's JSON
+# fields followed by the user's active custom fields as "custom.<field_key>";
+# field keys cannot contain a dot, so a key such as "year" never clashes.
+ExportFormat = Literal["csv", "xlsx"]
+
+
+async def _custom_field_keys(user_id: int) -> List[str]:
+    fields = (await user_fields(user_id)).ordered
+    return [f.field_key for f in fields if f.is_active]
+
+
+def _export_columns(model: Type[BaseModel], keys: List[str]) -> List[str]:
+    return [*model.model_fields, *(f"custom.{key}" for key in keys)]
+
+
+async def _single_chunk(rows: list) -> AsyncIterator[list]:
+    yield rows
+
+
+async def _export(
+    fmt: ExportFormat, name: str, columns: List[str], chunks: AsyncIterator[list]
+) -> StreamingResponse:
+    filename = f"{name}.{fmt}"
+    if fmt == "csv":
+        return csv_response(columns, chunks, filename)
+    return await xlsx_response(columns, chunks, filename, title=name)
+
+
+def _export_row(row, custom: Dict[str, Decimal], keys: List[str]) -> list:
+    return [
+        *row.model_dump().values(),
+        *(float(custom.get(key, 0)) for key in keys),
+    ]
+
+
+@router.get("/tables/monthly/export")
+async def export_monthly_table(
+    user=Depends(get_current_user),
+    ctx: StatsContext = Depends(get_stats_context),
+    person_id: Optional[int] = Query(default=None),
+    year: Optional[int] = Query(default=None),
+    month: Optional[int] = Query(default=None),
+    range: Optional[str] = Query(default=None),
+    format: ExportFormat = Query(default="xlsx", description="csv 或 xlsx"),
+):
+    """Monthly detail table as a spreadsheet, read and written in chunks."""
+    keys = await _custom_field_keys(user.id)
+    persons = await ctx.person_names()
+
+    async def chunks() -> AsyncIterator[list]:
+        async for recs in iter_salary_rows(
+            user.id,
+            STREAM_CHUNK_SIZE,
+            person_id=person_id,
+            year=year,
+            month=month,
+            ym_range=_range_bounds(range),
+        ):
+            custom = await custom_values_by_record([r.id for r in recs])
+            yield [
+                _export_row(_monthly_table_row(r, persons), custom.get(r.id, {}), keys)
+                for r in recs
+            ]
+
+    columns = _export_columns(MonthlyTableRow, keys)
+    return await _export(format, "monthly", columns, chunks())
+
+
+@router.get("/tables/annual/export")
+async def export_annual_table(
+    user=Depends(get_current_user),
+    ctx: StatsContext = Depends(get_stats_context),
+    year: int = Query(...),
+    format: ExportFormat = Query(default="xlsx", description="csv 或 xlsx"),
+):
+    """Annual summary table as a spreadsheet, with custom field totals."""
+    keys = await _custom_field_keys(user.id)
+    rows = await annual_table(user=user, ctx=ctx, year=year)
+    custom = await sum_custom_by_field(user.id, ("person_id",), year=year)
+    columns = _export_columns(AnnualTableRow, keys)
+    data = [_export_row(r, custom.get(r.person_id, {}), keys) for r in rows]
+    return await _export(format, f"annual-{year}", columns, _single_chunk(data))
+
+
+@router.get("/tables/annual-monthly/export")
+async def export_annual_monthly_table(
+    user=Depends(get_current_user),
+    ctx: StatsContext = Depends(get_stats_context),
+    year: int = Query(...),
+    person_id: Optional[int] = Query(default=None),
+    hide_empty: bool = Query(default=False),
+    format: ExportFormat = Query(default="xlsx", description="csv 或 xlsx"),
+):
+    """Annual by-month table as a spreadsheet, with custom field totals."""
+    keys = await _custom_field_keys(user.id)
+    rows = await annual_monthly_table(
+        user=user, ctx=ctx, year=year, person_id=person_id, hide_empty=hide_empty
+    )
+    custom = await sum_custom_by_field(
+        user.id, ("month",), person_id=person_id, year=year
+    )
+    columns = _export_columns(AnnualMonthlyRow, keys)
+    data = [_export_row(r, custom.get(r.month, {}), keys) for r in rows]
+    return await _export(
+        format, f"annual-monthly-{year}", columns, _single_chunk(data)
+    )
+
+
+# Series available to /batch, named after their endpoint paths
+_BATCH_SERIES = {
+    "monthly": monthly_stats,
+    "yearly": yearly_stats,
+    "family": family_summary,
+    "cumulative-insurance": cumulative_insurance,
+    "benefits": benefit_stats,
+    "income-composition": income_composition,
+    "net-income/monthly": net_income_monthly,
+    "gross-vs-net/monthly": gross_vs_net_monthly,
+    "deductions/breakdown": deductions_breakdown,
+    "contributions/cumulative": contributions_cumulative,
+    "tables/monthly": monthly_table,
+    "tables/annual": annual_table,
+    "tables/annual-monthly": annual_monthly_table,
+}
+
+
+def _batch_kwargs(func, user, ctx: StatsContext, filters: dict) -> dict:
+    """Arguments for calling a series endpoint the way FastAPI would.
+
+    Parameters the series does not take are ignored; the ones it takes but
+    the batch did not set fall back to the endpoint's own defaults.
+    """
+    kwargs = {}
+    for name, param in inspect.signature(func).parameters.items():
+        if name == "user":
+            kwargs[name] = user
+        elif name == "ctx":
+            kwargs[name] = ctx
+        elif filters.get(name) is not None:
+            kwargs[name] = filters[name]
+        else:
+            default = param.default
+            if isinstance(default, FieldInfo):
+                if default.is_required():
+                    raise HTTPException(status_code=422, detail=f"缺少参数 {name}")
+                default = default.default
+            kwargs[name] = default
+    return kwargs
+
+
+@router.get("/batch", response_model=StatsBatch)
+async def stats_batch(
+    user=Depends(get_current_user),
+    ctx: StatsContext = Depends(get_stats_context),
+    series: List[str] = Query(
+        ..., description="序列名，可重复或逗号分隔，如 yearly,tables/annual"
+    ),
+    person_id: Optional[int] = Query(default=None),
+    year: Optional[int] = Query(default=None),
+    month: Optional[int] = Query(default=None),
+    range: Optional[str] = Query(
+        default=None, description="时间范围，如 2024-01..2024-12"
+    ),
+    hide_empty: Optional[bool] = Query(default=None),
+):
+    """Several stats series for one shared filter in a single round trip.
+
+    The series share one request context, so a record set and its custom
+    values are loaded once however many series read them. Each series is
+    still cached on its own, exactly as if its endpoint had been called.
+    Series that fail (missing person, missing required parameter) are
+    reported under ``errors`` instead of failing the whole batch.
+    """
+    names = [n.strip() for item in series for n in item.split(",") if n.strip()]
+    unknown = [n for n in names if n not in _BATCH_SERIES]
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"未知的统计序列: {', '.join(unknown)}"
+        )
+
+    filters = dict(
+        person_id=person_id, year=year, month=month, range=range, hide_empty=hide_empty
+    )
+    results: Dict[str, object] = {}
+    errors: Dict[str, str] = {}
+    # Sequential on purpose: later series reuse what earlier ones loaded
+    for name in dict.fromkeys(names):
+        func = _BATCH_SERIES[name]
+        try:
+            results[name] = await func(**_batch_kwargs(func, user, ctx, filters))
+        except HTTPException as exc:
+            errors[name] = str(exc.detail)
+    return StatsBatch(series=results, errors=errors)
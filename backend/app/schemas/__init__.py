@@ -7,6 +7,8 @@ from .person import PersonOut as PersonOut
 from .salary import SalaryCreate as SalaryCreate
 from .salary import SalaryUpdate as SalaryUpdate
 from .salary import SalaryOut as SalaryOut
+from .salary import SalaryPage as SalaryPage
+from .salary import SalaryImportResult as SalaryImportResult
 from .stats import MonthlyStats as MonthlyStats
 from .stats import YearlyStats as YearlyStats
 from .stats import FamilySummary as FamilySummary
@@ -21,6 +23,8 @@ __all__ = [
     "SalaryCreate",
     "SalaryUpdate",
     "SalaryOut",
+    "SalaryPage",
+    "SalaryImportResult",
     "MonthlyStats",
     "YearlyStats",
     "FamilySummary",
@@ -1,4 +1,4 @@
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from pydantic import BaseModel
 
 
@@ -53,3 +53,22 @@ class SalaryOut(BaseModel):
     non_cash_benefits: float
     note: Optional[str] = None
     custom_fields: Dict[str, float] = {}  # {field_key: amount}
+
+
+class SalaryPage(BaseModel):
+    """One keyset page of salary records"""
+    items: List[SalaryOut]
+    # pass back as ``cursor`` for the following page; None on the last page
+    next_cursor: Optional[str] = None
+
+
+class SalaryImportRowError(BaseModel):
+    row: int  # spreadsheet row number, the header being row 1
+    errors: List[str]
+
+
+class SalaryImportResult(BaseModel):
+    created: int
+    updated: int
+    # rows that were skipped, with the reasons
+    errors: List[SalaryImportRowError] = []
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
 from decimal import Decimal
 
 
@@ -259,3 +259,11 @@ class AnnualMonthlyRow(BaseModel):
     benefits_total: float
     allowances_total: float
     actual_take_home: float
+
+
+class StatsBatch(BaseModel):
+    """Several stats series computed for one shared filter"""
+    # series name -> the body its own endpoint would return
+    series: Dict[str, Any]
+    # series name -> error detail for series that could not be computed
+    errors: Dict[str, str]
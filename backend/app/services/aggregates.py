@@ -0,0 +1,444 @@
+"""SQL aggregation helpers for the stats endpoints.
+
+Money columns are stored as DECIMAL(15,2), which SQLite keeps with NUMERIC
+affinity. Summing them directly would go through floating point, so every
+column is rounded to integer cents before ``SUM`` and converted back to an
+exact ``Decimal`` on the Python side. ``load_salary_rows`` reads single
+records the same way, as cents tuples rather than ORM instances.
+"""
+
+from decimal import Decimal
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from tortoise import connections
+
+from ..models import Person
+from .money import cents_to_float, from_cents
+from .stats_fields import COLUMN_FIELDS, SalaryRow
+
+
+# Fixed money columns on ``salary_records``
+SALARY_COLUMNS = COLUMN_FIELDS
+
+# Derived totals on ``salary_rollups``
+ROLLUP_COLUMNS = (
+    "income_total",
+    "deductions_total",
+    "benefits_total",
+    "net_income",
+    "tax",
+    "actual_take_home",
+    "non_cash_benefits",
+)
+
+# Inclusive ((start_year, start_month), (end_year, end_month)) bounds
+YMRange = Tuple[Tuple[int, int], Tuple[int, int]]
+
+_GROUP_COLUMNS = ("user_id", "person_id", "year", "month")
+
+# Bound parameters per ``IN (...)`` list; SQLite builds before 3.32 allow at
+# most 999 variables per statement
+_IN_CHUNK_SIZE = 900
+
+
+def _cents(expr: str) -> str:
+    return f"COALESCE(CAST(ROUND({expr} * 100) AS INTEGER), 0)"
+
+
+def _cents_sum(expr: str) -> str:
+    return f"COALESCE(SUM(CAST(ROUND({expr} * 100) AS INTEGER)), 0)"
+
+
+def _group_by(group_by: Sequence[str], user_col: str) -> Tuple[str, str]:
+    cols = []
+    for col in group_by:
+        if col not in _GROUP_COLUMNS:
+            raise ValueError(f"unsupported group column: {col}")
+        cols.append(user_col if col == "user_id" else f"r.{col}")
+    select = "".join(f"{expr} AS {col}, " for expr, col in zip(cols, group_by))
+    return select, ", ".join(cols)
+
+
+def _where(
+    user_col: str,
+    user_id: int,
+    person_id: Optional[int],
+    year: Optional[int],
+    month: Optional[int] = None,
+    ym_range: Optional[YMRange] = None,
+) -> Tuple[str, list]:
+    clauses = [f"{user_col} = ?"]
+    params: list = [user_id]
+    if person_id:
+        clauses.append("r.person_id = ?")
+        params.append(person_id)
+    if year:
+        clauses.append("r.year = ?")
+        params.append(year)
+    if month:
+        clauses.append("r.month = ?")
+        params.append(month)
+    if ym_range:
+        # Compound (year, month) bounds; the leading BETWEEN keeps it sargable
+        (y1, m1), (y2, m2) = ym_range
+        clauses.append(
+            "r.year BETWEEN ? AND ? AND (r.year > ? OR r.month >= ?) "
+            "AND (r.year < ? OR r.month <= ?)"
+        )
+        params.extend([y1, y2, y1, m1, y2, m2])
+    return " AND ".join(clauses), params
+
+
+def _id_chunks(ids: Sequence[int]) -> Iterator[Sequence[int]]:
+    for start in range(0, len(ids), _IN_CHUNK_SIZE):
+        yield ids[start : start + _IN_CHUNK_SIZE]
+
+
+def _key(row: dict, group_by: Sequence[str]):
+    if len(group_by) == 1:
+        return row[group_by[0]]
+    return tuple(row[col] for col in group_by)
+
+
+async def sum_salary_columns(
+    user_id: int,
+    group_by: Sequence[str],
+    *,
+    person_id: Optional[int] = None,
+    year: Optional[int] = None,
+    month: Optional[int] = None,
+) -> Dict[object, Dict[str, Decimal]]:
+    """Sum the fixed money columns per group.
+
+    Returns ``{group_key: {"months": n, column: Decimal, ...}}`` keyed by the
+    single group column value, or by a tuple when grouping by several columns.
+    Only groups that have at least one record are returned.
+    """
+    select, clause = _group_by(group_by, "p.user_id")
+    sums = ", ".join(f"{_cents_sum('r.' + col)} AS {col}" for col in SALARY_COLUMNS)
+    where, params = _where("p.user_id", user_id, person_id, year, month)
+    sql = (
+        f"SELECT {select}COUNT(*) AS months, {sums} "
+        "FROM salary_records r JOIN persons p ON p.id = r.person_id "
+        f"WHERE {where} GROUP BY {clause} ORDER BY {clause}"
+    )
+    rows = await connections.get("default").execute_query_dict(sql, params)
+    result: Dict[object, Dict[str, Decimal]] = {}
+    for row in rows:
+        agg: Dict[str, Decimal] = {"months": row["months"]}
+        for col in SALARY_COLUMNS:
+            agg[col] = from_cents(row[col])
+        result[_key(row, group_by)] = agg
+    return result
+
+
+async def load_salary_rows(
+    user_id: int,
+    *,
+    person_id: Optional[int] = None,
+    year: Optional[int] = None,
+    month: Optional[int] = None,
+    ym_range: Optional[YMRange] = None,
+) -> List[SalaryRow]:
+    """The user's salary records matching the filters, in id order.
+
+    Reads only the columns the stats endpoints use, with amounts as cents,
+    and skips model instantiation entirely.
+    """
+    amounts = ", ".join(f"{_cents('r.' + col)}" for col in SALARY_COLUMNS)
+    where, params = _where("p.user_id", user_id, person_id, year, month, ym_range)
+    sql = (
+        f"SELECT r.id, r.person_id, r.year, r.month, r.note, {amounts} "
+        "FROM salary_records r JOIN persons p ON p.id = r.person_id "
+        f"WHERE {where} ORDER BY r.id"
+    )
+    _, rows = await connections.get("default").execute_query(sql, params)
+    return [SalaryRow._make(row) for row in rows]
+
+
+async def iter_salary_rows(
+    user_id: int,
+    chunk_size: int,
+    *,
+    person_id: Optional[int] = None,
+    year: Optional[int] = None,
+    month: Optional[int] = None,
+    ym_range: Optional[YMRange] = None,
+) -> AsyncIterator[List[SalaryRow]]:
+    """``load_salary_rows`` in (year, month, person_id) order, chunk by chunk.
+
+    Each chunk is one keyset query of at most ``chunk_size`` rows, so memory
+    stays bounded however many records match.
+    """
+    amounts = ", ".join(f"{_cents('r.' + col)}" for col in SALARY_COLUMNS)
+    where, params = _where("p.user_id", user_id, person_id, year, month, ym_range)
+    sql = (
+        f"SELECT r.id, r.person_id, r.year, r.month, r.note, {amounts} "
+        "FROM salary_records r JOIN persons p ON p.id = r.person_id "
+        f"WHERE {where} AND (r.year, r.month, r.person_id) > (?, ?, ?) "
+        "ORDER BY r.year, r.month, r.person_id LIMIT ?"
+    )
+    after = (0, 0, 0)
+    while True:
+        _, rows = await connections.get("default").execute_query(
+            sql, [*params, *after, chunk_size]
+        )
+        chunk = [SalaryRow._make(row) for row in rows]
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last = chunk[-1]
+        after = (last.year, last.month, last.person_id)
+
+
+async def sum_rollups(
+    user_id: int,
+    group_by: Sequence[str],
+    *,
+    person_id: Optional[int] = None,
+    year: Optional[int] = None,
+    ym_range: Optional[YMRange] = None,
+) -> Dict[object, Dict[str, Decimal]]:
+    """Sum the precomputed ``salary_rollups`` totals per group.
+
+    Same shape as ``sum_salary_columns`` but over ``ROLLUP_COLUMNS``.
+    """
+    # Rollups carry user_id themselves, no need to join persons
+    select, clause = _group_by(group_by, "r.user_id")
+    sums = ", ".join(f"{_cents_sum('r.' + col)} AS {col}" for col in ROLLUP_COLUMNS)
+    where, params = _where(
+        "r.user_id", user_id, person_id, year, ym_range=ym_range
+    )
+    sql = (
+        f"SELECT {select}COUNT(*) AS months, {sums} "
+        f"FROM salary_rollups r WHERE {where} GROUP BY {clause} ORDER BY {clause}"
+    )
+    rows = await connections.get("default").execute_query_dict(sql, params)
+    result: Dict[object, Dict[str, Decimal]] = {}
+    for row in rows:
+        agg: Dict[str, Decimal] = {"months": row["months"]}
+        for col in ROLLUP_COLUMNS:
+            agg[col] = from_cents(row[col])
+        result[_key(row, group_by)] = agg
+    return result
+
+
+async def sum_custom_values(
+    user_id: int,
+    group_by: Sequence[str],
+    *,
+    person_id: Optional[int] = None,
+    year: Optional[int] = None,
+    month: Optional[int] = None,
+) -> Dict[object, Dict[str, Decimal]]:
+    """Sum custom field values per group, split the way ``compute_payroll`` does.
+
+    Each group maps to ``income``, ``cash_income``, ``non_cash`` and
+    ``deduction`` totals. Groups without custom values are omitted.
+    """
+    select, clause = _group_by(group_by, "p.user_id")
+    income = _cents_sum("CASE WHEN f.field_type = 'income' THEN v.amount END")
+    non_cash = _cents_sum(
+        "CASE WHEN f.field_type = 'income' AND f.is_non_cash THEN v.amount END"
+    )
+    deduction = _cents_sum("CASE WHEN f.field_type = 'deduction' THEN v.amount END")
+    where, params = _where("p.user_id", user_id, person_id, year, month)
+    sql = (
+        f"SELECT {select}{income} AS income, {non_cash} AS non_cash, "
+        f"{deduction} AS deduction "
+        "FROM custom_salary_values v "
+        "JOIN salary_fields f ON f.id = v.salary_field_id "
+        "JOIN salary_records r ON r.id = v.salary_record_id "
+        "JOIN persons p ON p.id = r.person_id "
+        f"WHERE {where} GROUP BY {clause}"
+    )
+    rows = await connections.get("default").execute_query_dict(sql, params)
+    result: Dict[object, Dict[str, Decimal]] = {}
+    for row in rows:
+        result[_key(row, group_by)] = {
+            "income": from_cents(row["income"]),
+            "cash_income": from_cents(row["income"] - row["non_cash"]),
+            "non_cash": from_cents(row["non_cash"]),
+            "deduction": from_cents(row["deduction"]),
+        }
+    return result
+
+
+async def sum_custom_by_field(
+    user_id: int,
+    group_by: Sequence[str],
+    *,
+    person_id: Optional[int] = None,
+    year: Optional[int] = None,
+    month: Optional[int] = None,
+) -> Dict[object, Dict[str, Decimal]]:
+    """Sum custom values per group and field: ``{group_key: {field_key: sum}}``."""
+    select, clause = _group_by(group_by, "p.user_id")
+    where, params = _where("p.user_id", user_id, person_id, year, month)
+    sql = (
+        f"SELECT {select}f.field_key AS field_key, "
+        f"{_cents_sum('v.amount')} AS amount "
+        "FROM custom_salary_values v "
+        "JOIN salary_fields f ON f.id = v.salary_field_id "
+        "JOIN salary_records r ON r.id = v.salary_record_id "
+        "JOIN persons p ON p.id = r.person_id "
+        f"WHERE {where} GROUP BY {clause}, f.field_key"
+    )
+    rows = await connections.get("default").execute_query_dict(sql, params)
+    result: Dict[object, Dict[str, Decimal]] = {}
+    for row in rows:
+        group = result.setdefault(_key(row, group_by), {})
+        group[row["field_key"]] = from_cents(row["amount"])
+    return result
+
+
+async def custom_values_by_record(
+    record_ids: Sequence[int],
+) -> Dict[int, Dict[str, Decimal]]:
+    """Custom values of the given records: ``{record_id: {field_key: amount}}``."""
+    result: Dict[int, Dict[str, Decimal]] = {}
+    for ids in _id_chunks(record_ids):
+        marks = ", ".join("?" * len(ids))
+        sql = (
+            "SELECT v.salary_record_id, f.field_key, "
+            f"{_cents('v.amount')} "
+            "FROM custom_salary_values v "
+            "JOIN salary_fields f ON f.id = v.salary_field_id "
+            f"WHERE v.salary_record_id IN ({marks})"
+        )
+        _, rows = await connections.get("default").execute_query(sql, list(ids))
+        for record_id, field_key, amount in rows:
+            result.setdefault(record_id, {})[field_key] = from_cents(amount)
+    return result
+
+
+async def load_custom_values(
+    record_ids: Sequence[int],
+) -> Tuple[Dict[int, Dict[str, float]], Dict[int, List[dict]]]:
+    """Custom values of the given records, in the two shapes the routes use.
+
+    Returns ``{record_id: {field_key: amount}}`` for responses and
+    ``{record_id: [{field_type, is_non_cash, category, amount}, ...]}`` for
+    ``compute_payroll``, both built from one joined query per id chunk.
+    """
+    by_record: Dict[int, Dict[str, float]] = {}
+    payroll_by_record: Dict[int, List[dict]] = {}
+    for ids in _id_chunks(record_ids):
+        marks = ", ".join("?" * len(ids))
+        sql = (
+            "SELECT v.salary_record_id, f.field_key, f.field_type, f.is_non_cash, "
+            f"f.category, {_cents('v.amount')} "
+            "FROM custom_salary_values v "
+            "JOIN salary_fields f ON f.id = v.salary_field_id "
+            f"WHERE v.salary_record_id IN ({marks})"
+        )
+        _, rows = await connections.get("default").execute_query(sql, list(ids))
+        for record_id, field_key, field_type, is_non_cash, category, cents in rows:
+            amount = cents_to_float(cents)
+            by_record.setdefault(record_id, {})[field_key] = amount
+            payroll_by_record.setdefault(record_id, []).append(
+                {
+                    "field_type": field_type,
+                    "is_non_cash": bool(is_non_cash),
+                    "category": category,
+                    "amount": amount,
+                }
+            )
+    return by_record, payroll_by_record
+
+
+CONTRIBUTION_COLUMNS = ("pension_insurance", "medical_insurance", "housing_fund")
+HISTORY_COLUMNS = ("pension_history", "medical_history", "housing_fund_history")
+
+
+async def sum_contributions_by_person(user_id: int) -> List[dict]:
+    """Per-person contribution totals joined with the person's history columns.
+
+    One grouped query for all of the user's persons; persons without records
+    get zero totals. History values are converted exactly as the ORM would.
+    """
+    sums = ", ".join(
+        f"{_cents_sum('r.' + col)} AS {col}" for col in CONTRIBUTION_COLUMNS
+    )
+    history = ", ".join(f"p.{col} AS {col}" for col in HISTORY_COLUMNS)
+    sql = (
+        f"SELECT p.id AS id, p.name AS name, {history}, {sums} "
+        "FROM persons p LEFT JOIN salary_records r ON r.person_id = p.id "
+        "WHERE p.user_id = ? GROUP BY p.id ORDER BY p.id"
+    )
+    rows = await connections.get("default").execute_query_dict(sql, [user_id])
+    fields_map = Person._meta.fields_map
+    result: List[dict] = []
+    for row in rows:
+        item = {"id": row["id"], "name": row["name"]}
+        for col in HISTORY_COLUMNS:
+            item[col] = fields_map[col].to_python_value(row[col])
+        for col in CONTRIBUTION_COLUMNS:
+            item[col] = from_cents(row[col])
+        result.append(item)
+    return result
+
+
+EMPTY_CUSTOM: Dict[str, Decimal] = {
+    "income": Decimal("0"),
+    "cash_income": Decimal("0"),
+    "non_cash": Decimal("0"),
+    "deduction": Decimal("0"),
+}
+
+
+def insurance_total(agg: Dict[str, Decimal]) -> Decimal:
+    """五险一金 subtotal of an aggregated row (tax excluded)."""
+    return (
+        agg["pension_insurance"]
+        + agg["medical_insurance"]
+        + agg["unemployment_insurance"]
+        + agg["critical_illness_insurance"]
+        + agg["enterprise_annuity"]
+        + agg["housing_fund"]
+    )
+
+
+def payroll_totals(
+    agg: Dict[str, Decimal], custom: Dict[str, Decimal]
+) -> Dict[str, Decimal]:
+    """Aggregate equivalent of summing ``compute_payroll`` over the group.
+
+    All payroll outputs are linear in their inputs and every stored amount
+    already has two decimal places, so summing first gives the same result
+    as summing per-record payroll results.
+    """
+    gross = agg["base_salary"] + agg["performance_salary"] + custom["income"]
+    total_deductions = insurance_total(agg) + custom["deduction"]
+    return {
+        "total_income": gross,
+        "total_deductions": total_deductions,
+        "gross_income": gross,
+        "tax": agg["tax"],
+        "net_income": gross - total_deductions - agg["tax"],
+        "actual_take_home": (
+            agg["base_salary"]
+            + agg["performance_salary"]
+            + custom["cash_income"]
+            - total_deductions
+            - agg["tax"]
+        ),
+        "non_cash_benefits": custom["non_cash"],
+    }
+
+
+def unified_totals(agg: Dict[str, Decimal]) -> Dict[str, Decimal]:
+    """Unified-spec totals for an aggregated row.
+
+    Mirrors the per-record helpers in ``routes/stats.py``; the legacy
+    allowance/benefit columns moved to custom fields and contribute zero.
+    """
+    income_total = agg["base_salary"] + agg["performance_salary"]
+    deductions_total = insurance_total(agg)
+    return {
+        "income_total": income_total,
+        "deductions_total": deductions_total,
+        "benefits_total": Decimal("0"),
+        "net_income": income_total - deductions_total,
+    }
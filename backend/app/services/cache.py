@@ -0,0 +1,169 @@
+"""In-process caching for stats responses.
+
+Every user has a data version, stored in the ``data_versions`` table, that
+write handlers bump after a mutation. Cached stats results and ETags are
+keyed by the version they were computed from, so a lookup after any write
+misses instead of serving stale data, whichever worker handled the write.
+
+The cache itself lives in the worker process. Requests read each user's
+version from the database once; see ``track_request_versions``.
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+from tortoise import connections
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+from config import STATS_CACHE_MAX_ENTRIES, STATS_CACHE_TTL_SECONDS
+
+
+class TTLCache:
+    """Small LRU cache whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            # A TTL of zero disables the cache
+            return
+        expires = time.monotonic() + ttl
+        self._data[key] = (expires, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+stats_cache = TTLCache(STATS_CACHE_MAX_ENTRIES, STATS_CACHE_TTL_SECONDS)
+
+_MISSING = object()
+_UNKEYED_PARAMS = ("user", "ctx")
+
+# Versions already read by the current request, by user id
+_request_versions: ContextVar[Optional[Dict[int, int]]] = ContextVar(
+    "_request_versions", default=None
+)
+
+
+def track_request_versions() -> None:
+    """Read each user's data version at most once in the current request.
+
+    Called by the HTTP middleware before anything else runs, so the ETag
+    and every cached series of a request (``/batch`` has many) share one
+    read. Outside a request every ``data_version`` call reads the database.
+    """
+    _request_versions.set({})
+
+
+async def data_version(user_id: int) -> int:
+    seen = _request_versions.get()
+    if seen is not None and user_id in seen:
+        return seen[user_id]
+    _, rows = await connections.get("default").execute_query(
+        "SELECT version FROM data_versions WHERE user_id = ?", [user_id]
+    )
+    version = rows[0][0] if rows else 0
+    if seen is not None:
+        seen[user_id] = version
+    return version
+
+
+async def bump_data_version(user_id: int) -> None:
+    """Mark every cached result and ETag of the user as stale.
+
+    Call once the write is committed. New versions are at least the current
+    time in microseconds, so they keep increasing even if the database is
+    replaced by an older copy and ETags issued before never match again.
+    """
+    await connections.get("default").execute_query(
+        "INSERT INTO data_versions (user_id, version) VALUES (?, ?) "
+        "ON CONFLICT (user_id) DO UPDATE "
+        "SET version = MAX(version + 1, excluded.version)",
+        [user_id, time.time_ns() // 1000],
+    )
+    seen = _request_versions.get()
+    if seen is not None:
+        seen.pop(user_id, None)
+
+
+def cached_stats(func):
+    """Cache a stats route's result per (user, endpoint, query params).
+
+    The route must take the current user as its ``user`` parameter; a
+    per-request ``ctx`` parameter is not part of the key. The data version is
+    read before computing, so a write that lands while the result is being
+    computed still invalidates it.
+    """
+
+    @wraps(func)
+    async def wrapper(**kwargs):
+        user = kwargs["user"]
+        params = tuple(
+            sorted(
+                (k, v)
+                for k, v in kwargs.items()
+                if k not in _UNKEYED_PARAMS and v is not None
+            )
+        )
+        # Entries from older versions are never looked up again and age out
+        key = (user.id, await data_version(user.id), func.__name__, params)
+        result = stats_cache.get(key, _MISSING)
+        if result is _MISSING:
+            result = await func(**kwargs)
+            stats_cache.set(key, result)
+        return result
+
+    return wrapper
+
+
+async def data_etag(
+    user_id: int, path: str, query: Iterable[Tuple[str, str]]
+) -> str:
+    """Strong ETag for a GET whose response depends only on the user's data.
+
+    Every worker reads the same version, so any of them can answer 304, and
+    the ETag does not depend on the stats cache or its TTL.
+    """
+    params = "&".join(f"{k}={v}" for k, v in sorted(query))
+    raw = f"{user_id}:{await data_version(user_id)}:{path}?{params}"
+    return '"' + hashlib.sha256(raw.encode()).hexdigest()[:32] + '"'
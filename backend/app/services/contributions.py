@@ -0,0 +1,62 @@
+"""Maintenance of the ``contribution_index`` prefix sums.
+
+Each row holds a person's running pension, medical and housing fund totals
+up to and including that month, so a cumulative chart over any range is a
+slice of the index plus the person's history values.
+"""
+
+from tortoise import connections
+from tortoise.transactions import in_transaction
+
+from ..models import ContributionIndex, SalaryRecord
+
+_RUNNING = (
+    "SUM(CAST(ROUND({col} * 100) AS INTEGER)) "
+    "OVER (PARTITION BY person_id ORDER BY year, month)"
+)
+
+_SELECT_RUNNING = (
+    "SELECT person_id, year, month, "
+    f"{_RUNNING.format(col='pension_insurance')} AS pension_cents, "
+    f"{_RUNNING.format(col='medical_insurance')} AS medical_cents, "
+    f"{_RUNNING.format(col='housing_fund')} AS housing_fund_cents "
+    "FROM salary_records"
+)
+
+_INSERT = (
+    "INSERT INTO contribution_index "
+    "(person_id, year, month, pension_cents, medical_cents, housing_fund_cents) "
+)
+
+
+async def refresh_contributions(person_id: int, year: int, month: int) -> None:
+    """Recompute the person's index rows from (year, month) onward.
+
+    Earlier rows are unaffected by a change at (year, month), so only the
+    tail is rewritten.
+    """
+    conn = connections.get("default")
+    after = "(year > ? OR (year = ? AND month >= ?))"
+    await conn.execute_query(
+        f"DELETE FROM contribution_index WHERE person_id = ? AND {after}",
+        [person_id, year, year, month],
+    )
+    await conn.execute_query(
+        f"{_INSERT}SELECT * FROM ({_SELECT_RUNNING} WHERE person_id = ?) "
+        f"WHERE {after}",
+        [person_id, year, year, month],
+    )
+
+
+async def rebuild_contributions() -> int:
+    """Regenerate the whole index from the raw salary records."""
+    async with in_transaction() as conn:
+        await conn.execute_query("DELETE FROM contribution_index")
+        await conn.execute_query(f"{_INSERT}{_SELECT_RUNNING}")
+    return await ContributionIndex.all().count()
+
+
+async def ensure_contributions() -> None:
+    """Backfill the index for databases created before the table existed."""
+    if await ContributionIndex.all().count() != await SalaryRecord.all().count():
+        await rebuild_contributions()
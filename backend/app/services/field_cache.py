@@ -0,0 +1,85 @@
+"""Process-level cache of each user's ``SalaryField`` definitions.
+
+Field definitions are read by every salary save, import, export and field
+listing but change rarely. Entries are keyed by a per-user version stored in
+the ``salary_field_versions`` table, which the handlers in
+``routes/salary_fields.py`` bump after every write. Every lookup reads the
+version first (a primary key lookup, much cheaper than loading the fields),
+so a field created or changed through any worker is seen by all of them on
+their next lookup, and a load that finishes after a change is never served.
+"""
+
+from datetime import datetime
+from typing import Dict, List, NamedTuple
+
+from tortoise import connections
+
+from ..models import SalaryField
+from .cache import TTLCache
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+from config import STATS_CACHE_MAX_ENTRIES, STATS_CACHE_TTL_SECONDS
+
+
+class FieldDef(NamedTuple):
+    id: int
+    name: str
+    field_key: str
+    field_type: str
+    category: str
+    is_non_cash: bool
+    display_order: int
+    is_active: bool
+    created_at: datetime
+
+
+class UserFields(NamedTuple):
+    # every field, inactive ones included, by (display_order, id)
+    ordered: List[FieldDef]
+    # field_key -> id of the active fields
+    active_ids: Dict[str, int]
+
+
+field_cache = TTLCache(STATS_CACHE_MAX_ENTRIES, STATS_CACHE_TTL_SECONDS)
+
+
+async def fields_version(user_id: int) -> int:
+    _, rows = await connections.get("default").execute_query(
+        "SELECT version FROM salary_field_versions WHERE user_id = ?", [user_id]
+    )
+    return rows[0][0] if rows else 0
+
+
+async def invalidate_fields(user_id: int) -> None:
+    """Make every worker reload the user's definitions.
+
+    Call after any field write, once it is committed or inside its
+    transaction; bumping earlier would let a concurrent load of the old
+    definitions be cached under the new version.
+    """
+    await connections.get("default").execute_query(
+        "INSERT INTO salary_field_versions (user_id, version) VALUES (?, 1) "
+        "ON CONFLICT (user_id) DO UPDATE SET version = version + 1",
+        [user_id],
+    )
+
+
+async def user_fields(user_id: int) -> UserFields:
+    # The version is read before loading, like the stats data version
+    key = (user_id, await fields_version(user_id))
+    fields = field_cache.get(key)
+    if fields is None:
+        rows = await (
+            SalaryField.filter(user_id=user_id)
+            .order_by("display_order", "id")
+            .values_list(*FieldDef._fields)
+        )
+        ordered = [FieldDef._make(row) for row in rows]
+        fields = UserFields(
+            ordered=ordered,
+            active_ids={f.field_key: f.id for f in ordered if f.is_active},
+        )
+        field_cache.set(key, fields)
+    return fields
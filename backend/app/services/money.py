@@ -0,0 +1,35 @@
+"""Integer-cents money helpers.
+
+Amounts are stored as DECIMAL(15,2), so the payroll and stats code carries
+them as ``int`` cents: sums are exact and much cheaper than building
+``Decimal`` values from strings. Convert back with ``from_cents`` or
+``cents_to_float`` only when building a response.
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+
+Cents = int
+
+_ONE = Decimal("1")
+
+
+def to_cents(value) -> Cents:
+    """Whole cents of an amount, ROUND_HALF_UP; ``None`` counts as zero."""
+    if value is None:
+        return 0
+    d = value if isinstance(value, Decimal) else Decimal(str(value))
+    return int(d.scaleb(2).quantize(_ONE, rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents: Cents) -> Decimal:
+    return Decimal(cents).scaleb(-2)
+
+
+def cents_to_float(cents: Cents) -> float:
+    # Correctly rounded, so equal to float(from_cents(cents))
+    return cents / 100
+
+
+def cents_percent(part: Cents, total: Cents) -> float:
+    """``part / total * 100`` computed exactly and rounded once to float."""
+    return float(Decimal(part) / Decimal(total) * 100)
@@ -0,0 +1,88 @@
+"""Maintenance of the ``salary_rollups`` table.
+
+Every write that touches a salary record or its custom values calls
+``refresh_rollups`` inside the same transaction, so the stats endpoints can
+sum precomputed rows instead of recomputing totals per record.
+"""
+
+from typing import List, Optional
+
+from tortoise.transactions import in_transaction
+
+from ..models import SalaryRecord, SalaryRollup, User
+from .aggregates import (
+    EMPTY_CUSTOM,
+    sum_salary_columns,
+    sum_custom_values,
+    payroll_totals,
+    unified_totals,
+)
+
+_KEY = ("person_id", "year", "month")
+
+
+async def refresh_rollups(
+    user_id: int,
+    *,
+    person_id: Optional[int] = None,
+    year: Optional[int] = None,
+    month: Optional[int] = None,
+) -> int:
+    """Recompute rollup rows for the user's records matching the filter.
+
+    Rows whose record no longer exists are removed. Returns the number of
+    rollup rows written.
+    """
+    sums = await sum_salary_columns(
+        user_id, _KEY, person_id=person_id, year=year, month=month
+    )
+    customs = await sum_custom_values(
+        user_id, _KEY, person_id=person_id, year=year, month=month
+    )
+
+    rollups: List[SalaryRollup] = []
+    for (pid, y, m), agg in sums.items():
+        unified = unified_totals(agg)
+        calc = payroll_totals(agg, customs.get((pid, y, m), EMPTY_CUSTOM))
+        rollups.append(
+            SalaryRollup(
+                user_id=user_id,
+                person_id=pid,
+                year=y,
+                month=m,
+                income_total=unified["income_total"],
+                deductions_total=unified["deductions_total"],
+                benefits_total=unified["benefits_total"],
+                net_income=unified["net_income"],
+                tax=calc["tax"],
+                actual_take_home=calc["actual_take_home"],
+                non_cash_benefits=calc["non_cash_benefits"],
+            )
+        )
+
+    filters = {"user_id": user_id}
+    if person_id:
+        filters["person_id"] = person_id
+    if year:
+        filters["year"] = year
+    if month:
+        filters["month"] = month
+    await SalaryRollup.filter(**filters).delete()
+    if rollups:
+        await SalaryRollup.bulk_create(rollups)
+    return len(rollups)
+
+
+async def rebuild_rollups() -> int:
+    """Regenerate every rollup row from the raw salary records."""
+    total = 0
+    for user_id in await User.all().values_list("id", flat=True):
+        async with in_transaction():
+            total += await refresh_rollups(user_id)
+    return total
+
+
+async def ensure_rollups() -> None:
+    """Backfill rollups for databases created before the table existed."""
+    if await SalaryRollup.all().count() != await SalaryRecord.all().count():
+        await rebuild_rollups()
@@ -0,0 +1,237 @@
+"""Bulk import of salary records from CSV or XLSX spreadsheets.
+
+The sheet has one record per row and a header row naming the columns:
+
+- ``person_id`` or ``person`` (the person's name) and ``year``, ``month``
+- any of the fixed amount columns (``base_salary`` ... ``tax``) and ``note``
+- any active custom field, by its ``field_key``
+
+Validation runs column-wise over the whole sheet with pandas. Valid rows are
+upserted on (person_id, year, month) with batched inserts in one transaction.
+Only the columns present in the sheet are written over existing records.
+"""
+
+import io
+import os
+import zipfile
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+import pandas as pd
+from openpyxl.utils.exceptions import InvalidFileException
+from tortoise.transactions import in_transaction
+
+from ..models import CustomSalaryValue, Person, SalaryRecord
+from .contributions import refresh_contributions
+from .field_cache import user_fields
+from .money import from_cents, to_cents
+from .payroll import PAYROLL_COLUMNS
+from .rollups import refresh_rollups
+
+_KEY = ("person_id", "year", "month")
+_BATCH_SIZE = 500
+# Amounts are DECIMAL(15,2): at most 13 digits before the decimal point
+_AMOUNT_LIMIT = 10**13
+
+# What the readers raise for a corrupt or mislabelled file: pandas' CSV errors
+# are ValueErrors; an XLSX may not be a zip, lack parts (KeyError) or hold
+# malformed XML (a SyntaxError subclass with both ElementTree and lxml).
+_READ_ERRORS = (
+    ValueError,
+    KeyError,
+    SyntaxError,
+    zipfile.BadZipFile,
+    InvalidFileException,
+)
+
+
+def read_sheet(content: bytes, filename: str) -> pd.DataFrame:
+    """Raw cells of the first sheet; blank cells become NaN."""
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext not in (".csv", ".xlsx", ".xlsm"):
+        raise ValueError("仅支持 CSV 或 XLSX 文件")
+    try:
+        if ext == ".csv":
+            frame = pd.read_csv(
+                io.BytesIO(content),
+                dtype=str,
+                keep_default_na=False,
+                encoding="utf-8-sig",
+            )
+        else:
+            frame = pd.read_excel(io.BytesIO(content), dtype=object, engine="openpyxl")
+    except _READ_ERRORS as exc:
+        kind = "CSV" if ext == ".csv" else "XLSX"
+        raise ValueError(f"无法读取文件，请确认是有效的 {kind} 文件") from exc
+    frame.columns = [str(c).strip() for c in frame.columns]
+    blank = frame.apply(
+        lambda col: col.map(lambda v: isinstance(v, str) and not v.strip())
+    )
+    return frame.mask(blank)
+
+
+def _integers(column: pd.Series) -> pd.Series:
+    """Numeric values that are whole numbers; anything else becomes NaN."""
+    values = pd.to_numeric(column, errors="coerce")
+    return values.where(values % 1 == 0)
+
+
+def validate_sheet(
+    frame: pd.DataFrame, persons: Dict[int, str], field_keys: List[str]
+) -> Tuple[List[dict], Dict[int, List[str]]]:
+    """Split a sheet into importable rows and per-row errors.
+
+    ``persons`` is the user's ``{id: name}``, ``field_keys`` their active
+    custom field keys. Rows come back as dicts with the record columns
+    (amounts as ``Decimal``) and a ``custom`` dict; errors are keyed by the
+    spreadsheet row number, the header being row 1.
+    """
+    columns = set(frame.columns)
+    unknown = columns - {"person_id", "person", "year", "month", "note"}
+    unknown -= set(PAYROLL_COLUMNS) | set(field_keys)
+    if unknown:
+        raise ValueError(f"未知的列: {', '.join(sorted(unknown))}")
+    missing = {"year", "month"} - columns
+    if not columns & {"person_id", "person"}:
+        missing.add("person_id")
+    if missing:
+        raise ValueError(f"缺少列: {', '.join(sorted(missing))}")
+
+    errors: Dict[int, List[str]] = defaultdict(list)
+
+    def flag(mask: pd.Series, message: str) -> None:
+        for i in frame.index[mask.to_numpy(dtype=bool)]:
+            errors[i].append(message)
+
+    if "person_id" in columns:
+        person_id = _integers(frame["person_id"])
+    else:
+        counts = Counter(persons.values())
+        by_name = {name: pid for pid, name in persons.items() if counts[name] == 1}
+        names = frame["person"].map(lambda v: v if pd.isna(v) else str(v).strip())
+        person_id = pd.to_numeric(names.map(by_name), errors="coerce")
+        ambiguous = [name for name, n in counts.items() if n > 1]
+        flag(names.isin(ambiguous), "人员名称不唯一，请使用 person_id")
+    flag(~person_id.isin(list(persons)), "人员不存在")
+
+    year = _integers(frame["year"])
+    flag(~year.between(1900, 2100), "年份无效")
+    month = _integers(frame["month"])
+    flag(~month.between(1, 12), "月份无效")
+
+    amount_columns = [c for c in (*PAYROLL_COLUMNS, *field_keys) if c in columns]
+    for col in amount_columns:
+        values = pd.to_numeric(frame[col], errors="coerce")
+        flag(values.isna() & frame[col].notna(), f"{col} 不是数字")
+        # inf and out-of-range values parse as numbers but do not fit
+        # DECIMAL(15,2); NaN compares False and is left to the check above
+        flag(values.abs().round(2) >= _AMOUNT_LIMIT, f"{col} 超出范围")
+
+    keys = pd.DataFrame({"person_id": person_id, "year": year, "month": month})
+    complete = keys.notna().all(axis=1)
+    flag(complete & keys.duplicated(keep=False), "人员与年月重复")
+
+    rows: List[dict] = []
+    valid = frame.index.difference(list(errors))
+    for i in valid:
+        cells = frame.loc[i]
+        row = {
+            "person_id": int(person_id[i]),
+            "year": int(year[i]),
+            "month": int(month[i]),
+            "custom": {},
+        }
+        for col in amount_columns:
+            cell = cells[col]
+            amount = from_cents(0 if pd.isna(cell) else to_cents(cell))
+            if col in PAYROLL_COLUMNS:
+                row[col] = amount
+            else:
+                row["custom"][col] = amount
+        if "note" in columns:
+            note = cells["note"]
+            row["note"] = None if pd.isna(note) else str(note)[:255]
+        rows.append(row)
+
+    return rows, {int(i) + 2: messages for i, messages in sorted(errors.items())}
+
+
+async def import_salary_rows(
+    user_id: int, rows: List[dict], columns: List[str], field_keys: List[str]
+) -> Tuple[int, int]:
+    """Upsert validated rows in one transaction; returns (created, updated).
+
+    ``columns`` are the record columns present in the sheet; only those are
+    overwritten on existing records. Custom values of the sheet's custom
+    field columns replace the stored ones, zero amounts are dropped.
+    """
+    if not rows:
+        return 0, 0
+    person_ids = sorted({r["person_id"] for r in rows})
+    keys = [tuple(r[k] for k in _KEY) for r in rows]
+    active_ids = (await user_fields(user_id)).active_ids
+    fields = {key: active_ids[key] for key in field_keys if key in active_ids}
+
+    async with in_transaction():
+        stored = SalaryRecord.filter(person_id__in=person_ids)
+        before = set(await stored.values_list(*_KEY))
+        await SalaryRecord.bulk_create(
+            [
+                SalaryRecord(**{c: v for c, v in r.items() if c != "custom"})
+                for r in rows
+            ],
+            batch_size=_BATCH_SIZE,
+            on_conflict=_KEY,
+            update_fields=[*columns, "updated_at"],
+        )
+        ids = {
+            tuple(key): record_id
+            for record_id, *key in await stored.values_list("id", *_KEY)
+        }
+        record_ids = [ids[k] for k in keys]
+
+        if fields:
+            for start in range(0, len(record_ids), _BATCH_SIZE):
+                await CustomSalaryValue.filter(
+                    salary_record_id__in=record_ids[start : start + _BATCH_SIZE],
+                    salary_field_id__in=list(fields.values()),
+                ).delete()
+            await CustomSalaryValue.bulk_create(
+                [
+                    CustomSalaryValue(
+                        salary_record_id=record_id,
+                        salary_field_id=fields[key],
+                        amount=amount,
+                    )
+                    for record_id, r in zip(record_ids, rows)
+                    for key, amount in r["custom"].items()
+                    if key in fields and amount != 0
+                ],
+                batch_size=_BATCH_SIZE,
+            )
+
+        for pid in person_ids:
+            await refresh_rollups(user_id, person_id=pid)
+            year, month = min(k[1:] for k in keys if k[0] == pid)
+            await refresh_contributions(pid, year, month)
+
+    created = sum(1 for k in keys if k not in before)
+    return created, len(keys) - created
+
+
+async def import_salary_sheet(
+    user_id: int, content: bytes, filename: str
+) -> Tuple[int, int, Dict[int, List[str]]]:
+    """Parse, validate and import a spreadsheet for the user.
+
+    Returns (created, updated, errors by row number). Raises ``ValueError``
+    when the file as a whole cannot be imported.
+    """
+    frame = read_sheet(content, filename)
+    persons = dict(await Person.filter(user_id=user_id).values_list("id", "name"))
+    field_keys = list((await user_fields(user_id)).active_ids)
+    rows, errors = validate_sheet(frame, persons, field_keys)
+    columns = [c for c in (*PAYROLL_COLUMNS, "note") if c in frame.columns]
+    sheet_keys = [k for k in field_keys if k in frame.columns]
+    created, updated = await import_salary_rows(user_id, rows, columns, sheet_keys)
+    return created, updated, errors
@@ -0,0 +1,127 @@
+"""Where each logical stats field comes from.
+
+The stats schemas still expose the legacy allowance, benefit and deduction
+fields. Those moved to custom fields and are always reported as zero; the
+rest read a ``salary_records`` column. ``FIELD_SPECS`` states this once and
+the accessors below are compiled from it at import time, so the stats code
+never probes a record for attributes it does not have.
+
+The stats read path loads ``SalaryRow`` tuples rather than ORM instances,
+with every column already in integer cents; the accessors read those.
+"""
+
+from operator import attrgetter
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+from ..models import SalaryRecord
+from .money import Cents, cents_to_float
+
+COLUMN = "column"  # read from the salary_records column of the same name
+ZERO = "zero"  # legacy field, moved to custom fields; always zero
+
+FIELD_SPECS: Dict[str, str] = {
+    # income
+    "base_salary": COLUMN,
+    "performance_salary": COLUMN,
+    "high_temp_allowance": ZERO,
+    "low_temp_allowance": ZERO,
+    "computer_allowance": ZERO,
+    "communication_allowance": ZERO,
+    "comprehensive_allowance": ZERO,
+    "meal_allowance": ZERO,
+    "mid_autumn_benefit": ZERO,
+    "dragon_boat_benefit": ZERO,
+    "spring_festival_benefit": ZERO,
+    "other_income": ZERO,
+    # deductions
+    "pension_insurance": COLUMN,
+    "medical_insurance": COLUMN,
+    "unemployment_insurance": COLUMN,
+    "critical_illness_insurance": COLUMN,
+    "enterprise_annuity": COLUMN,
+    "housing_fund": COLUMN,
+    "other_deductions": ZERO,
+    "labor_union_fee": ZERO,
+    "performance_deduction": ZERO,
+    "tax": COLUMN,
+}
+
+COLUMN_FIELDS: Tuple[str, ...] = tuple(
+    name for name, kind in FIELD_SPECS.items() if kind == COLUMN
+)
+ZERO_FIELDS: Tuple[str, ...] = tuple(
+    name for name, kind in FIELD_SPECS.items() if kind == ZERO
+)
+
+_missing = [f for f in COLUMN_FIELDS if f not in SalaryRecord._meta.fields_map]
+if _missing:
+    raise RuntimeError(f"stats fields without a salary_records column: {_missing}")
+
+
+class SalaryRow(NamedTuple):
+    """Read-only salary record for the stats endpoints, amounts in cents."""
+
+    id: int
+    person_id: int
+    year: int
+    month: int
+    note: Optional[str]
+    base_salary: Cents
+    performance_salary: Cents
+    pension_insurance: Cents
+    medical_insurance: Cents
+    unemployment_insurance: Cents
+    critical_illness_insurance: Cents
+    enterprise_annuity: Cents
+    housing_fund: Cents
+    tax: Cents
+
+
+if SalaryRow._fields[5:] != COLUMN_FIELDS:
+    raise RuntimeError("SalaryRow amounts out of step with the stats columns")
+
+Accessor = Callable[[SalaryRow], Cents]
+
+
+def _zero(record) -> Cents:
+    return 0
+
+
+def cents_getter(name: str) -> Accessor:
+    """Accessor returning the field's value of a row in cents."""
+    if FIELD_SPECS[name] == ZERO:
+        return _zero
+    return attrgetter(name)
+
+
+def cents_sum(*names: str) -> Accessor:
+    """Accessor summing several fields; zero fields are dropped up front."""
+    columns = [n for n in names if FIELD_SPECS[n] == COLUMN]
+    if not columns:
+        return _zero
+    if len(columns) == 1:
+        return attrgetter(columns[0])
+    get = attrgetter(*columns)
+    return lambda record: sum(get(record))
+
+
+def schema_fields(model, suffix: str = "") -> Tuple[str, ...]:
+    """Registry fields a response model declares (as ``name + suffix``)."""
+    return tuple(
+        name for name in FIELD_SPECS if name + suffix in model.model_fields
+    )
+
+
+def float_fields(names: Iterable[str]) -> Callable[[SalaryRow], Dict[str, float]]:
+    """Builder of ``{name: float}`` response values for a row."""
+    names = tuple(names)
+    zeros = {n: 0.0 for n in names if FIELD_SPECS[n] == ZERO}
+    columns = [(n, attrgetter(n)) for n in names if FIELD_SPECS[n] == COLUMN]
+
+    def build(record) -> Dict[str, float]:
+        values = dict(zeros)
+        for name, get in columns:
+            values[name] = cents_to_float(get(record))
+        return values
+
+    return build
@@ -0,0 +1,217 @@
+"""Tortoise SQLite engine with a reader pool and a single queued writer.
+
+The stock SQLite client runs every statement on one connection behind one
+lock, so a long stats aggregation and a salary save wait for each other.
+With WAL, readers never block the writer nor each other, so this client
+keeps a few extra read-only connections (each aiosqlite connection has its
+own thread) and sends autocommit ``SELECT`` statements to whichever is
+idle.
+
+Autocommit writes go through a queue instead of taking the writer lock one
+at a time. The writer drains the queue in short transactions, with one
+savepoint per statement so a failing statement only fails its own caller.
+Each caller resumes once its batch has committed. A lone write runs
+directly, as in the stock client. Explicit transactions (``in_transaction``)
+run on the writer connection under its lock exactly as before, so they
+read their own writes.
+
+Use it through ``db.sqlite_connection``, which selects this engine when
+``SQLITE_READERS`` is above zero.
+"""
+
+import asyncio
+import sqlite3
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, List, Optional, Sequence, Tuple
+
+import aiosqlite
+from tortoise.backends.sqlite.client import SqliteClient, translate_exceptions
+from tortoise.exceptions import IntegrityError, OperationalError
+
+_MEMORY = ":memory:"
+
+
+def _translate(exc: Exception) -> Exception:
+    if isinstance(exc, sqlite3.IntegrityError):
+        return IntegrityError(exc)
+    if isinstance(exc, sqlite3.OperationalError):
+        return OperationalError(exc)
+    return exc
+
+
+def _settle(future: asyncio.Future, result: Any) -> None:
+    # The caller may have gone away, cancelling its future
+    if future.done():
+        return
+    if isinstance(result, Exception):
+        future.set_exception(result)
+    else:
+        future.set_result(result)
+
+
+def _is_read(query: str) -> bool:
+    return query.lstrip()[:6].upper() == "SELECT"
+
+
+class PooledSqliteClient(SqliteClient):
+    def __init__(
+        self, file_path: str, readers: int = 4, write_batch: int = 64, **kwargs: Any
+    ) -> None:
+        super().__init__(file_path, **kwargs)
+        # An in-memory database is private to its connection
+        self.reader_count = 0 if file_path == _MEMORY else int(readers)
+        self.write_batch = max(1, int(write_batch))
+        self._readers: List[aiosqlite.Connection] = []
+        self._idle: Optional[asyncio.Queue] = None
+        self._writes: Deque[Tuple[str, str, Any, asyncio.Future]] = deque()
+        self._writer: Optional[asyncio.Task] = None
+
+    async def create_connection(self, with_db: bool) -> None:
+        await super().create_connection(with_db)
+        if self._idle is None and self.reader_count:
+            idle: asyncio.Queue = asyncio.Queue()
+            for _ in range(self.reader_count):
+                conn = await aiosqlite.connect(self.filename, isolation_level=None)
+                conn.row_factory = sqlite3.Row
+                for pragma, val in (*self.pragmas.items(), ("query_only", "ON")):
+                    cursor = await conn.execute(f"PRAGMA {pragma}={val}")
+                    await cursor.close()
+                self._readers.append(conn)
+                idle.put_nowait(conn)
+            self._idle = idle
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            await asyncio.gather(self._writer, return_exceptions=True)
+            self._writer = None
+        for conn in self._readers:
+            await conn.close()
+        self._readers = []
+        self._idle = None
+        await super().close()
+
+    @asynccontextmanager
+    async def _reader(self):
+        if self._idle is None:
+            await self.create_connection(with_db=True)
+        conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put_nowait(conn)
+
+    # Reads
+
+    @translate_exceptions
+    async def execute_query(
+        self, query: str, values: Optional[list] = None
+    ) -> Tuple[int, Sequence[dict]]:
+        if not _is_read(query):
+            return await self._write("query", query, values)
+        if not self.reader_count:
+            return await super().execute_query(query, values)
+        query = query.replace("\x00", "'||CHAR(0)||'")
+        async with self._reader() as conn:
+            self.log.debug("%s: %s", query, values)
+            rows = await conn.execute_fetchall(query, values)
+            return len(rows), rows
+
+    @translate_exceptions
+    async def execute_query_dict(
+        self, query: str, values: Optional[list] = None
+    ) -> List[dict]:
+        if not _is_read(query):
+            _, rows = await self._write("query", query, values)
+            return list(map(dict, rows))
+        if not self.reader_count:
+            return await super().execute_query_dict(query, values)
+        query = query.replace("\x00", "'||CHAR(0)||'")
+        async with self._reader() as conn:
+            self.log.debug("%s: %s", query, values)
+            return list(map(dict, await conn.execute_fetchall(query, values)))
+
+    # Writes
+
+    async def execute_insert(self, query: str, values: list) -> int:
+        return await self._write("insert", query, values)
+
+    async def execute_many(self, query: str, values: List[list]) -> None:
+        await self._write("many", query, values)
+
+    async def _write(self, kind: str, query: str, values: Any) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._writes.append((kind, query, values, future))
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._drain_writes())
+        return await future
+
+    async def _run_write(self, conn: aiosqlite.Connection, kind, query, values):
+        self.log.debug("%s: %s", query, values)
+        if kind == "insert":
+            return (await conn.execute_insert(query, values))[0]
+        if kind == "many":
+            await conn.executemany(query, values)
+            return None
+        query = query.replace("\x00", "'||CHAR(0)||'")
+        start = conn.total_changes
+        rows = await conn.execute_fetchall(query, values)
+        return (conn.total_changes - start) or len(rows), rows
+
+    async def _drain_writes(self) -> None:
+        while self._writes:
+            batch = []
+            while self._writes and len(batch) < self.write_batch:
+                batch.append(self._writes.popleft())
+            try:
+                # Same lock as explicit transactions, which therefore never
+                # interleave with a batch
+                async with self.acquire_connection() as conn:
+                    if len(batch) == 1:
+                        await self._run_alone(conn, *batch[0])
+                    else:
+                        await self._run_batch(conn, batch)
+            except Exception as exc:
+                for *_, future in batch:
+                    _settle(future, _translate(exc))
+
+    async def _run_alone(self, conn, kind, query, values, future) -> None:
+        try:
+            if kind == "many":
+                await conn.execute("BEGIN")
+                try:
+                    await conn.executemany(query, values)
+                except Exception:
+                    await conn.rollback()
+                    raise
+                await conn.commit()
+                result = None
+            else:
+                result = await self._run_write(conn, kind, query, values)
+        except Exception as exc:
+            result = _translate(exc)
+        _settle(future, result)
+
+    async def _run_batch(self, conn, batch) -> None:
+        results = []
+        try:
+            await conn.execute("BEGIN IMMEDIATE")
+            for kind, query, values, _ in batch:
+                await conn.execute("SAVEPOINT queued_write")
+                try:
+                    result = await self._run_write(conn, kind, query, values)
+                except Exception as exc:
+                    await conn.execute("ROLLBACK TO queued_write")
+                    result = _translate(exc)
+                await conn.execute("RELEASE queued_write")
+                results.append(result)
+            await conn.commit()
+        except Exception as exc:
+            if conn.in_transaction:
+                await conn.rollback()
+            results = [_translate(exc)] * len(batch)
+        for (*_, future), result in zip(batch, results):
+            _settle(future, result)
+
+
+client_class = PooledSqliteClient
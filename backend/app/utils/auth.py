@@ -1,3 +1,7 @@
+import asyncio
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 
@@ -5,17 +9,38 @@ from jose import jwt, JWTError
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from tortoise.exceptions import DoesNotExist
 
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-from config import JWT_SECRET, JWT_ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from config import (
+    JWT_SECRET,
+    JWT_ALGORITHM,
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    BCRYPT_ROUNDS,
+    PASSWORD_HASH_QUEUE,
+    PASSWORD_HASH_WORKERS,
+    TOKEN_CACHE_MAX_ENTRIES,
+    USER_CACHE_MAX_ENTRIES,
+    USER_CACHE_TTL_SECONDS,
+)
 from ..models import User
+from ..services.cache import TTLCache
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+# Resolved users by id. No route changes or deletes a user; one that does
+# must also pop the user here, and other workers notice once the TTL runs out.
+user_cache = TTLCache(USER_CACHE_MAX_ENTRIES, USER_CACHE_TTL_SECONDS)
+
+# Claims of tokens whose signature was already checked, by SHA-256 of the
+# token. Every entry is stored with the time left until the token's ``exp``.
+token_cache = TTLCache(TOKEN_CACHE_MAX_ENTRIES, ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+
 def _truncate_password_utf8(password: str, max_bytes: int = 72) -> str:
     password_bytes = password.encode("utf-8")
     if len(password_bytes) <= max_bytes:
@@ -33,7 +58,31 @@ def _truncate_password_utf8(password: str, max_bytes: int = 72) -> str:
     return ""
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+# bcrypt takes a few hundred milliseconds of CPU per call and releases the
+# GIL, so password work runs on its own small pool instead of the event loop
+_password_pool = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password"
+)
+_password_jobs = 0
+
+
+class PasswordWorkBusy(Exception):
+    """More password hashes are pending than the pool and its queue allow."""
+
+
+async def _run_password_job(func, *args):
+    global _password_jobs
+    if _password_jobs >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE:
+        raise PasswordWorkBusy()
+    _password_jobs += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_password_pool, func, *args)
+    finally:
+        _password_jobs -= 1
+
+
+def _verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     Verify a password against its hash.
     
@@ -45,7 +94,7 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
-def hash_password(password: str) -> str:
+def _hash_password(password: str) -> str:
     """
     Hash a password using bcrypt.
     
@@ -63,6 +112,16 @@ def hash_password(password: str) -> str:
         return pwd_context.hash(password)
 
 
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """``_verify_password`` on the password pool; may raise ``PasswordWorkBusy``."""
+    return await _run_password_job(_verify_password, plain_password, hashed_password)
+
+
+async def hash_password(password: str) -> str:
+    """``_hash_password`` on the password pool; may raise ``PasswordWorkBusy``."""
+    return await _run_password_job(_hash_password, password)
+
+
 def create_access_token(
     subject: dict, expires_minutes: int = ACCESS_TOKEN_EXPIRE_MINUTES
 ) -> str:
@@ -71,22 +130,57 @@ def create_access_token(
     return jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 
+def token_claims(user: User) -> dict:
+    return {"sub": user.username, "uid": user.id}
+
+
+def verified_claims(token: str) -> Optional[dict]:
+    """The token's claims if its signature and expiry check out, else None."""
+    key = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(key)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        except JWTError:
+            return None
+        ttl = payload.get("exp", 0) - time.time()
+        if ttl > 0:
+            token_cache.set(key, payload, ttl)
+    return payload
+
+
+async def resolve_user(token: str) -> Optional[User]:
+    """Return the user a bearer token belongs to, or None if it is invalid.
+
+    Tokens carry the user id, so a warm lookup does not touch the database.
+    Tokens issued before the id claim existed are looked up by username.
+    """
+    payload = verified_claims(token)
+    if payload is None:
+        return None
+    username: Optional[str] = payload.get("sub")
+    if username is None:
+        return None
+    user_id = payload.get("uid")
+    if not isinstance(user_id, int):
+        return await User.get_or_none(username=username)
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await User.get_or_none(id=user_id)
+        if user is None:
+            return None
+        user_cache.set(user_id, user)
+    # The name check rejects a token whose user was replaced under the same id
+    return user if user.username == username else None
+
+
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        username: Optional[str] = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-
-    try:
-        user = await User.get(username=username)
-        return user
-    except DoesNotExist:
+    user = await resolve_user(token)
+    if user is None:
         raise credentials_exception
+    return user
@@ -0,0 +1,43 @@
+from typing import Optional
+
+from starlette.requests import Request
+
+from ..services.cache import data_etag
+from .auth import resolve_user
+from .streaming import NDJSON
+
+# GET endpoints whose responses are a pure function of the user's data
+CONDITIONAL_GET_PREFIXES = (
+    "/api/stats/",
+    "/api/salaries/",
+    "/api/persons/",
+    "/api/salary-fields/",
+)
+
+
+async def request_etag(request: Request) -> Optional[str]:
+    """ETag for an authenticated GET, or None when it cannot be computed."""
+    if request.method != "GET":
+        return None
+    if not request.url.path.startswith(CONDITIONAL_GET_PREFIXES):
+        return None
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    user = await resolve_user(token)
+    if user is None:
+        return None
+    query = request.query_params.multi_items()
+    # The NDJSON and JSON representations of a URL need distinct ETags
+    if NDJSON in request.headers.get("accept", ""):
+        query.append(("accept", NDJSON))
+    return await data_etag(user.id, request.url.path, query)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # "*" is not honoured: the ETag is computed before the route runs, so
+    # it cannot tell whether the resource exists
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return any(c.removeprefix("W/") == etag for c in candidates)
@@ -0,0 +1,111 @@
+import csv
+import io
+import tempfile
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, Optional, Sequence
+
+from fastapi.responses import StreamingResponse
+from openpyxl import Workbook
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+NDJSON = "application/x-ndjson"
+XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Rows fetched from the database per query when streaming
+STREAM_CHUNK_SIZE = 500
+
+# Exports larger than this spill from memory to a temporary file
+_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+_READ_SIZE = 64 * 1024
+
+
+def wants_ndjson(accept: Optional[str], stream: bool = False) -> bool:
+    """Whether a list endpoint should stream NDJSON instead of a JSON array."""
+    return stream or NDJSON in (accept or "")
+
+
+async def _encode(chunks: AsyncIterable[Iterable[BaseModel]]) -> AsyncIterator[bytes]:
+    async for chunk in chunks:
+        body = "".join(row.model_dump_json() + "\n" for row in chunk)
+        if body:
+            yield body.encode()
+
+
+def ndjson_response(chunks: AsyncIterable[Iterable[BaseModel]]) -> StreamingResponse:
+    """One JSON object per line, written chunk by chunk as they are produced."""
+    return StreamingResponse(_encode(chunks), media_type=NDJSON)
+
+
+def _attachment(filename: str) -> dict:
+    return {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+
+async def _csv_lines(
+    columns: Sequence[str], chunks: AsyncIterable[Iterable[Sequence]]
+) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    # BOM so that Excel detects UTF-8
+    yield ("\ufeff" + buffer.getvalue()).encode()
+    async for chunk in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode()
+
+
+def csv_response(
+    columns: Sequence[str], chunks: AsyncIterable[Iterable[Sequence]], filename: str
+) -> StreamingResponse:
+    """CSV download written chunk by chunk as the rows are produced."""
+    return StreamingResponse(
+        _csv_lines(columns, chunks),
+        media_type="text/csv; charset=utf-8",
+        headers=_attachment(filename),
+    )
+
+
+def _read_and_close(spool) -> Iterator[bytes]:
+    try:
+        spool.seek(0)
+        while data := spool.read(_READ_SIZE):
+            yield data
+    finally:
+        spool.close()
+
+
+def _new_workbook(columns: Sequence[str], title: str):
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append(list(columns))
+    return workbook, sheet
+
+
+def _append_rows(sheet, rows: Iterable[Sequence]) -> None:
+    for row in rows:
+        sheet.append(list(row))
+
+
+async def xlsx_response(
+    columns: Sequence[str],
+    chunks: AsyncIterable[Iterable[Sequence]],
+    filename: str,
+    title: str,
+) -> StreamingResponse:
+    """XLSX download built with a write-only workbook.
+
+    Write-only sheets keep appended rows in a temporary file rather than in
+    memory. The zip container is only complete after ``save``, so the file
+    is assembled first and then streamed from a spooled temporary file.
+    Only fetching the chunks runs on the event loop; openpyxl's cell
+    conversion, appends and ``save`` run in the threadpool.
+    """
+    workbook, sheet = await run_in_threadpool(_new_workbook, columns, title)
+    async for chunk in chunks:
+        await run_in_threadpool(_append_rows, sheet, chunk)
+    spool = tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_SIZE)
+    await run_in_threadpool(workbook.save, spool)
+    return StreamingResponse(
+        _read_and_close(spool), media_type=XLSX, headers=_attachment(filename)
+    )
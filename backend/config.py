@@ -6,8 +6,44 @@ DATA_DIR = os.path.join(ROOT_DIR, "data")
 os.makedirs(DATA_DIR, exist_ok=True)
 DB_PATH = os.environ.get("DATABASE_PATH", os.path.join(DATA_DIR, "salarium.db"))
 
+# Pragmas run on every SQLite connection, in this order. busy_timeout comes
+# first so that switching to WAL waits for other connections' locks.
+SQLITE_PRAGMAS = {
+    "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+    # NORMAL only syncs at WAL checkpoints; a power cut may lose the last
+    # commits but never corrupts the database
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    # Negative values are KiB rather than pages
+    "cache_size": -int(os.environ.get("SQLITE_CACHE_SIZE_KIB", "65536")),
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "temp_store": os.environ.get("SQLITE_TEMP_STORE", "MEMORY"),
+}
+# Read-only connections for SELECTs next to the single writer; 0 falls back
+# to Tortoise's one-connection client
+SQLITE_READERS = int(os.environ.get("SQLITE_READERS", "4"))
+# Most queued autocommit writes committed in one transaction
+SQLITE_WRITE_BATCH = int(os.environ.get("SQLITE_WRITE_BATCH", "64"))
+
 JWT_SECRET = os.environ.get("JWT_SECRET", "super-secret-change-me")
 JWT_ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24
 
 CORS_ORIGINS = os.environ.get("CORS_ORIGINS", "*").split(",")
+
+# In-process stats response cache; a TTL of 0 disables it (ETags still work)
+STATS_CACHE_MAX_ENTRIES = int(os.environ.get("STATS_CACHE_MAX_ENTRIES", "1024"))
+STATS_CACHE_TTL_SECONDS = float(os.environ.get("STATS_CACHE_TTL_SECONDS", "300"))
+
+# bcrypt cost factor for new password hashes; existing hashes keep theirs
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+# Threads hashing and verifying passwords, and how many more requests may
+# wait for one before logins are turned away
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_QUEUE = int(os.environ.get("PASSWORD_HASH_QUEUE", "32"))
+
+# In-process cache of authenticated users, by id
+USER_CACHE_MAX_ENTRIES = int(os.environ.get("USER_CACHE_MAX_ENTRIES", "1024"))
+USER_CACHE_TTL_SECONDS = float(os.environ.get("USER_CACHE_TTL_SECONDS", "300"))
+# Verified access token claims, kept until the token expires
+TOKEN_CACHE_MAX_ENTRIES = int(os.environ.get("TOKEN_CACHE_MAX_ENTRIES", "1024"))
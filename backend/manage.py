@@ -0,0 +1,560 @@
+"""Maintenance commands for the Salarium backend.
+
+Usage:
+    python manage.py rebuild-rollups
+    python manage.py rebuild-contributions
+    python manage.py bench-login [--logins N]
+    python manage.py check-query-plans
+    python manage.py check-payroll [--records N] [--seed S]
+    python manage.py bench-stats [--records N] [--repeats N]
+    python manage.py migrate
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import tempfile
+import time
+import tracemalloc
+from decimal import Decimal
+from types import SimpleNamespace
+from urllib.parse import urlencode
+
+from fastapi import HTTPException
+from fastapi.dependencies.utils import get_flat_dependant
+from tortoise import Tortoise, connections
+
+from app.db import TORTOISE_ORM, sqlite_connection
+from app.main import create_app
+from app.migrations import migrate, schema_version
+from app.models import CustomSalaryValue, Person, SalaryField, SalaryRecord, User
+from app.routes.auth import login
+from app.schemas.auth import LoginRequest
+from app.services.aggregates import load_salary_rows, sum_salary_columns
+from app.services.cache import stats_cache
+from app.services.money import to_cents
+from app.services.payroll import (
+    PAYROLL_COLUMNS,
+    compute_payroll,
+    compute_payroll_batch,
+    payroll_inputs,
+    payroll_rows,
+)
+from app.services.rollups import rebuild_rollups
+from app.services.contributions import rebuild_contributions
+from app.utils import auth
+
+
+async def _rebuild_rollups(args) -> None:
+    count = await rebuild_rollups()
+    print(f"Rebuilt {count} salary rollups")
+
+
+async def _rebuild_contributions(args) -> None:
+    count = await rebuild_contributions()
+    print(f"Rebuilt {count} contribution index rows")
+
+
+async def _probe_latencies(stop: asyncio.Event, user_id: int) -> list:
+    """Time a stats aggregate query back to back until ``stop`` is set."""
+    samples = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await sum_salary_columns(user_id, ("year",))
+        samples.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.005)
+    return samples
+
+
+def _describe(samples: list) -> str:
+    if len(samples) == 1:
+        # The loop was blocked for the whole burst
+        return f"one sample {samples[0]:8.1f} ms"
+    p95 = statistics.quantiles(samples, n=20)[-1]
+    return (
+        f"p50 {statistics.median(samples):6.1f} ms  p95 {p95:6.1f} ms  "
+        f"max {max(samples):6.1f} ms"
+    )
+
+
+async def _bench_login(args) -> None:
+    """Stats query latency while a burst of logins is being verified.
+
+    Runs against a temporary database. The ``inline`` phase verifies
+    passwords on the event loop, as the login route used to.
+    """
+    user = await User.create(
+        username="bench", password_hash=await auth.hash_password("bench")
+    )
+    person = await Person.create(user=user, name="bench")
+    await SalaryRecord.bulk_create(
+        [
+            SalaryRecord(person=person, year=y, month=m, base_salary=10000)
+            for y in range(2015, 2025)
+            for m in range(1, 13)
+        ]
+    )
+    payload = LoginRequest(username="bench", password="bench")
+
+    async def pooled() -> None:
+        await login(payload)
+
+    async def inline() -> None:
+        auth._verify_password(payload.password, user.password_hash)
+
+    async def measure(name, burst) -> None:
+        stop = asyncio.Event()
+        probe = asyncio.create_task(_probe_latencies(stop, user.id))
+        start = time.perf_counter()
+        if burst is None:
+            await asyncio.sleep(1)
+            rate = ""
+        else:
+            results = await asyncio.gather(
+                *(burst() for _ in range(args.logins)), return_exceptions=True
+            )
+            elapsed = time.perf_counter() - start
+            busy = sum(isinstance(r, HTTPException) for r in results)
+            rate = f"  {(args.logins - busy) / elapsed:5.1f} logins/s, {busy} busy"
+        stop.set()
+        print(f"{name:8} stats {_describe(await probe)}{rate}")
+
+    await measure("idle", None)
+    await measure("pooled", pooled)
+    await measure("inline", inline)
+
+
+async def _seed_stats(app, records: int) -> tuple:
+    """Register a user through the API and bulk insert ``records`` records.
+
+    Returns (user, token). Each person gets one record per month, and every
+    record has a value for each of two custom fields.
+    """
+    credentials = {"username": "stats", "password": "stats"}
+    await _asgi_request(app, "POST", "/api/auth/register", json=credentials)
+    _, body = await _asgi_request(app, "POST", "/api/auth/login", json=credentials)
+    user = await User.get(username="stats")
+
+    fields = [
+        await SalaryField.create(
+            user=user,
+            name=key,
+            field_key=key,
+            field_type=field_type,
+            category=category,
+            is_non_cash=field_type == "income",
+        )
+        for key, field_type, category in (
+            ("meal", "income", "allowance"),
+            ("union", "deduction", "other_deduction"),
+        )
+    ]
+    months_per_person = 40 * 12
+    batch = []
+    for i in range(records):
+        if i % months_per_person == 0:
+            person = await Person.create(user=user, name=f"P{i // months_per_person}")
+        year, month = divmod(i % months_per_person, 12)
+        batch.append(
+            SalaryRecord(
+                person=person,
+                year=1990 + year,
+                month=month + 1,
+                base_salary=Decimal(10000 + i % 997),
+                performance_salary=Decimal(i % 3001).scaleb(-1),
+                pension_insurance=Decimal("800.16"),
+                medical_insurance=Decimal("200.04"),
+                housing_fund=Decimal(1200 + i % 13),
+                tax=Decimal(i % 4999).scaleb(-2),
+            )
+        )
+    await SalaryRecord.bulk_create(batch, batch_size=1000)
+    record_ids = await SalaryRecord.filter(person__user_id=user.id).values_list(
+        "id", flat=True
+    )
+    await CustomSalaryValue.bulk_create(
+        [
+            CustomSalaryValue(
+                salary_record_id=record_id,
+                salary_field=field,
+                amount=Decimal(record_id % 500),
+            )
+            for record_id in record_ids
+            for field in fields
+        ],
+        batch_size=1000,
+    )
+    await rebuild_rollups()
+    await rebuild_contributions()
+    return user, json.loads(body)["access_token"]
+
+
+async def _timed(repeats: int, call) -> tuple:
+    """Median wall time in ms over ``repeats`` calls, and one traced peak."""
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        await call()
+        samples.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    try:
+        await call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return statistics.median(samples), peak / 2**20
+
+
+async def _bench_stats(args) -> None:
+    """Time the record loaders and every stats endpoint on seeded data.
+
+    Runs against a temporary database. ``orm`` loads the records as model
+    instances, as the stats endpoints used to; ``rows`` is the cents loader
+    they use now. Endpoints are timed with the stats cache cleared before
+    every call, so each one computes its result.
+    """
+    app = create_app()
+    user, token = await _seed_stats(app, args.records or 50000)
+    print(f"Seeded {await SalaryRecord.all().count()} salary records")
+
+    async def orm() -> None:
+        await SalaryRecord.filter(person__user_id=user.id).order_by("id")
+
+    async def rows() -> None:
+        await load_salary_rows(user.id)
+
+    for name, call in (("orm", orm), ("rows", rows)):
+        ms, mib = await _timed(args.repeats, call)
+        print(f"load {name:40} {ms:8.1f} ms  peak {mib:6.1f} MiB")
+
+    # Values for the query parameters some endpoints require; /batch only
+    # combines the others and is skipped
+    person = await Person.filter(user=user).order_by("id").first()
+    known = {"year": 2000, "person_id": person.id}
+    for route in app.routes:
+        path = getattr(route, "path", "")
+        if "GET" not in getattr(route, "methods", ()) or "{" in path:
+            continue
+        if not path.startswith("/api/stats/"):
+            continue
+        required = [
+            param.name
+            for param in get_flat_dependant(route.dependant).query_params
+            if param.field_info.is_required()
+        ]
+        if not set(required) <= known.keys():
+            continue
+        params = {name: known[name] for name in required}
+
+        async def call(path=path, params=params) -> None:
+            stats_cache.clear()
+            status, body = await _asgi_request(app, "GET", path, token, params=params)
+            if status != 200:
+                raise RuntimeError(f"GET {path} failed with {status}: {body!r}")
+
+        ms, mib = await _timed(args.repeats, call)
+        print(f"GET  {path:40} {ms:8.1f} ms  peak {mib:6.1f} MiB")
+
+
+async def _migrate(args) -> None:
+    # _run has already applied pending migrations
+    print(f"Schema version {await schema_version()}")
+
+
+async def _asgi_request(app, method: str, path: str, token=None, **kwargs):
+    """Call the app in-process; returns (status, body).
+
+    ``params`` become the query string, ``json`` the request body.
+    """
+    headers = [(b"content-type", b"application/json")]
+    if token:
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    body = json.dumps(kwargs["json"]).encode() if "json" in kwargs else b""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": urlencode(kwargs.get("params", {}), doseq=True).encode(),
+        "root_path": "",
+        "headers": headers,
+        "client": ("127.0.0.1", 0),
+        "server": ("localhost", 80),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    response = {"status": None, "body": b""}
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # Never disconnect; streaming responses finish on their own
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    await app(scope, receive, send)
+    return response["status"], response["body"]
+
+
+class _QueryLog(logging.Handler):
+    """Collects the distinct statements Tortoise runs, with their parameters."""
+
+    _PLANNED = ("SELECT", "UPDATE", "DELETE", "WITH")
+
+    def __init__(self) -> None:
+        super().__init__(logging.DEBUG)
+        self.queries: dict = {}
+
+    def emit(self, record) -> None:
+        # Statements are logged as ("%s: %s", query, values)
+        if not isinstance(record.args, tuple) or len(record.args) != 2:
+            return
+        query, values = record.args
+        if isinstance(query, str) and query.lstrip().upper().startswith(
+            self._PLANNED
+        ):
+            self.queries.setdefault(query, values)
+
+
+# A plan step reading a whole table, as opposed to "SCAN t USING INDEX ..."
+_TABLE_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+
+async def _drive_endpoints(app) -> None:
+    """Seed a user through the API, then call every GET route with filters."""
+    credentials = {"username": "plans", "password": "plans"}
+    await _asgi_request(app, "POST", "/api/auth/register", json=credentials)
+    _, body = await _asgi_request(app, "POST", "/api/auth/login", json=credentials)
+    token = json.loads(body)["access_token"]
+
+    async def call(method, path, **kwargs):
+        status, body = await _asgi_request(app, method, path, token, **kwargs)
+        if status >= 500:
+            raise RuntimeError(f"{method} {path} failed with {status}: {body!r}")
+        return json.loads(body) if method != "GET" else body
+
+    field = await call(
+        "POST",
+        "/api/salary-fields/",
+        json={
+            "name": "meal",
+            "field_key": "meal",
+            "field_type": "income",
+            "category": "allowance",
+            "is_non_cash": True,
+        },
+    )
+    person_ids = []
+    for name in ("A", "B"):
+        person = await call("POST", "/api/persons/", json={"name": name})
+        person_ids.append(person["id"])
+    for pid in person_ids:
+        for year in (2023, 2024):
+            for month in range(1, 13):
+                record = await call(
+                    "POST",
+                    f"/api/salaries/{pid}",
+                    json={
+                        "year": year,
+                        "month": month,
+                        "base_salary": 10000,
+                        "pension_insurance": 800,
+                        "custom_fields": {"meal": 300},
+                    },
+                )
+    pid = person_ids[-1]
+    await call("PUT", f"/api/salaries/{record['id']}", json={"tax": 12.5})
+    await call("PUT", f"/api/salary-fields/{field['id']}", json={"name": "Meal"})
+    await call("PUT", f"/api/persons/{pid}", json={"note": "plans"})
+
+    filters = [
+        {},
+        {"year": 2024},
+        {"year": 2024, "month": 3},
+        {"person_id": pid},
+        {"person_id": pid, "year": 2024},
+        {"range": "2023-06..2024-03"},
+        {"stream": "true"},
+        {"limit": 5, "sort": "desc"},
+        {"format": "csv"},
+    ]
+    path_params = {"person_id": pid, "record_id": record["id"], "field_id": field["id"]}
+    for route in app.routes:
+        path = getattr(route, "path", "")
+        if "GET" not in getattr(route, "methods", ()) or not path.startswith("/api"):
+            continue
+        path = path.format(**{k: v for k, v in path_params.items() if k in path})
+        for params in filters:
+            await call("GET", path, params=params)
+
+    await call("DELETE", f"/api/salaries/{record['id']}")
+    await call("DELETE", f"/api/salary-fields/{field['id']}")
+    await call("DELETE", f"/api/persons/{pid}")
+
+
+async def _check_query_plans(args) -> None:
+    """Fail when any statement an endpoint runs reads a whole table.
+
+    Runs on a scratch database. Without ``ANALYZE`` statistics SQLite plans
+    as if every table were large, so the plans show which access paths the
+    schema lacks whatever the amount of seed data.
+    """
+    log = _QueryLog()
+    logger = logging.getLogger("tortoise.db_client")
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(log)
+    try:
+        await _drive_endpoints(create_app())
+    finally:
+        logger.removeHandler(log)
+
+    conn = connections.get("default")
+    failures = 0
+    for query, values in log.queries.items():
+        _, plan = await conn.execute_query(f"EXPLAIN QUERY PLAN {query}", values)
+        scans = [row[3] for row in plan if _TABLE_SCAN.match(row[3])]
+        if scans:
+            failures += 1
+            print(f"{'; '.join(scans)}\n    {' '.join(query.split())}\n")
+    print(f"{len(log.queries)} statements checked, {failures} with table scans")
+    if failures:
+        raise SystemExit(1)
+
+
+def _random_amount(rng: random.Random):
+    """A stored DECIMAL(15,2) amount, biased towards rounding edge cases."""
+    roll = rng.random()
+    if roll < 0.05:
+        return None
+    if roll < 0.15:
+        # Half a unit at every rounding position the results go through
+        cents = rng.choice(("05", "50"))
+        return Decimal(f"{rng.randrange(-10**6, 10**6)}.{cents}")
+    if roll < 0.2:
+        return Decimal(rng.randrange(-(10**15) + 1, 10**15)).scaleb(-2)
+    return Decimal(rng.randrange(0, 10**7)).scaleb(-2)
+
+
+async def _check_payroll(args) -> None:
+    """Fail when ``compute_payroll_batch`` disagrees with ``compute_payroll``.
+
+    Compares the per-record ROUND_HALF_UP results for random records, with
+    the batch fed both ``Decimal`` amounts and ``SalaryRow``-style int cents.
+    """
+    rng = random.Random(args.seed)
+    records, custom = [], {}
+    for record_id in range(args.records or 20000):
+        records.append(
+            SimpleNamespace(
+                id=record_id,
+                **{col: _random_amount(rng) for col in PAYROLL_COLUMNS},
+            )
+        )
+        custom[record_id] = [
+            {
+                "field_type": rng.choice(("income", "deduction")),
+                "is_non_cash": rng.random() < 0.5,
+                "amount": _random_amount(rng),
+            }
+            for _ in range(rng.randrange(4))
+        ]
+    rows = [
+        SimpleNamespace(
+            id=r.id, **{col: to_cents(getattr(r, col)) for col in PAYROLL_COLUMNS}
+        )
+        for r in records
+    ]
+    inputs = {
+        "decimal": payroll_inputs(records, custom),
+        "cents": payroll_inputs(rows, custom, cents=True),
+    }
+    batches = {
+        name: payroll_rows(compute_payroll_batch(**columns))
+        for name, columns in inputs.items()
+    }
+
+    failures = 0
+    for i, record in enumerate(records):
+        expected = compute_payroll(
+            **{col: getattr(record, col) for col in PAYROLL_COLUMNS},
+            custom_fields=custom[record.id],
+        )
+        for name, batch in batches.items():
+            if batch[i] != expected:
+                failures += 1
+                if failures <= 10:
+                    print(f"record {record.id} ({name}): {batch[i]} != {expected}")
+    print(f"{len(records)} records checked (seed {args.seed}), {failures} mismatches")
+    if failures:
+        raise SystemExit(1)
+
+
+COMMANDS = {
+    "rebuild-rollups": _rebuild_rollups,
+    "rebuild-contributions": _rebuild_contributions,
+    "bench-login": _bench_login,
+    "check-query-plans": _check_query_plans,
+    "check-payroll": _check_payroll,
+    "bench-stats": _bench_stats,
+    "migrate": _migrate,
+}
+
+# Commands that must not touch the configured database
+_SCRATCH_COMMANDS = {
+    "bench-login",
+    "bench-stats",
+    "check-query-plans",
+    "check-payroll",
+}
+
+
+async def _run(command, args, config) -> None:
+    await Tortoise.init(config=config)
+    await Tortoise.generate_schemas()
+    for applied in await migrate():
+        print(f"Applied migration {applied}")
+    try:
+        await command(args)
+    finally:
+        await Tortoise.close_connections()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Salarium maintenance commands")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument(
+        "--logins", type=int, default=32, help="bench-login: logins per burst"
+    )
+    parser.add_argument(
+        "--records",
+        type=int,
+        help="check-payroll: random records (20000); "
+        "bench-stats: seeded records (50000)",
+    )
+    parser.add_argument(
+        "--repeats", type=int, default=5, help="bench-stats: timed calls per step"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="check-payroll: seed")
+    args = parser.parse_args()
+    config = TORTOISE_ORM
+    if args.command in _SCRATCH_COMMANDS:
+        scratch = os.path.join(tempfile.mkdtemp(), "bench.db")
+        connection = sqlite_connection(scratch)
+        config = {**TORTOISE_ORM, "connections": {"default": connection}}
+    asyncio.run(_run(COMMANDS[args.command], args, config))
+
+
+if __name__ == "__main__":
+    main()
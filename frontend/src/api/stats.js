@@ -72,3 +72,10 @@ export async function getAnnualMonthlyTable(filter) {
   const { data } = await api.get('/stats/tables/annual-monthly', { params })
   return data
 }
+
+export async function getStatsBatch(filter, series) {
+  // series: endpoint paths under /stats, e.g. ['yearly', 'tables/annual']
+  const params = { ...paramsFromFilter(filter), series: series.join(',') }
+  const { data } = await api.get('/stats/batch', { params })
+  return data
+}
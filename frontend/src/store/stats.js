@@ -12,8 +12,20 @@ import {
   getMonthlyTable,
   getAnnualTable,
   getAnnualMonthlyTable,
+  getStatsBatch,
 } from '../api/stats'
 
+// Store cache names -> /stats/batch series names
+const BATCH_SERIES = {
+  netMonthly: 'net-income/monthly',
+  grossVsNet: 'gross-vs-net/monthly',
+  incomeComposition: 'income-composition',
+  deductions: 'deductions/breakdown',
+  contribCumulative: 'contributions/cumulative',
+  tableMonthly: 'tables/monthly',
+  tableAnnual: 'tables/annual',
+}
+
 function cacheKey(name, filter) {
   const parts = [name]
   if (filter.personId) parts.push(`p:${filter.personId}`)
@@ -134,6 +146,21 @@ export const useStatsStore = defineStore('stats', {
       return this._useCache('tableAnnualMonthly', () => getAnnualMonthlyTable(this.filter))
     },
 
+    // Fill the cache for several series with one request; series the batch
+    // could not compute are left for their own loaders to fetch and report.
+    async prefetch(names) {
+      const filter = this.filter
+      try {
+        const { series } = await getStatsBatch(filter, names.map((n) => BATCH_SERIES[n]))
+        for (const name of names) {
+          const data = series[BATCH_SERIES[name]]
+          if (data !== undefined) this.cache[cacheKey(name, filter)] = data
+        }
+      } catch (e) {
+        // fall back to per-series requests
+      }
+    },
+
     // helpers
     invalidateCache() {
       this.cache = {}
@@ -153,6 +180,9 @@ export const useStatsStore = defineStore('stats', {
         this.invalidateCache()
         this.isRefreshing = true
         try {
+          const names = ['netMonthly', 'grossVsNet', 'incomeComposition', 'deductions', 'tableMonthly', 'tableAnnual']
+          if (this.personId) names.push('contribCumulative')
+          await this.prefetch(names)
           const tasks = [
             this.loadMonthlyNetIncome(),
             this.loadGrossVsNetMonthly(),